@@ -0,0 +1,264 @@
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import cv2
+
+import detect
+import digipyro
+import frameindex
+#------------------------------------------------------------------------------
+# *** COMMAND LINE INTERFACE SETUP ***
+# initial message for program
+msg = """ This program digitally rotates every movie of an experiment session.
+The movies are rotated in parallel, movies that are already rotated with the
+same settings are skipped, and a report of the run is written next to the
+rotated movies. The area of interest must be given with --center and
+--radius, --roi or --auto, since no selection window is opened."""
+fmt = argparse.ArgumentDefaultsHelpFormatter
+parser = argparse.ArgumentParser(description=msg,
+                                 formatter_class=fmt)
+
+# collecting arguments for the user to change
+parser.add_argument('inputs', type=str, nargs='+',
+                    help=('The movies to rotate. Each one can be a directory, '
+                          'a glob pattern or a single movie.'))
+
+parser.add_argument('-o', '--out', type=str, required=True,
+                    help='The directory the rotated movies are saved in.')
+
+parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                    help='The number of movies rotated at the same time.')
+
+parser.add_argument('--t0', type=float, default=0,
+                    help='The start time for the digital rotation.')
+
+parser.add_argument('--t1', type=float, default=0,
+                    help=('The end time for the digital rotation. If left to '
+                          'default, it will go through the entire film.'))
+
+parser.add_argument('--rpm', type=float, default=10,
+                    help='The digital rotation given to the movies.')
+
+parser.add_argument('--crop', action='store_true',
+                    help=('Crop each frame to the square around the area of '
+                          'interest before rotating it.'))
+
+parser.add_argument('--workers', type=int, default=1,
+                    help='The number of threads that rotate each movie.')
+
+parser.add_argument('--center', type=digipyro.point, default=None,
+                    help='The axis of rotation as X,Y in pixels.')
+
+parser.add_argument('--radius', type=float, default=None,
+                    help='The radius of the area of interest in pixels.')
+
+parser.add_argument('--roi', type=str, default=None,
+                    help='A JSON file with the area of interest.')
+
+parser.add_argument('--auto', action='store_true',
+                    help=('Detect the rim of the tank in each movie. Movies '
+                          'where the detection is not confident fail.'))
+
+parser.add_argument('--auto-threshold', type=float, default=0.5,
+                    help=('The confidence, between 0 and 1, the automatic '
+                          'detection needs to be used.'))
+
+parser.add_argument('--force', action='store_true',
+                    help='Rotate every movie, even if it is up to date.')
+#------------------------------------------------------------------------------
+
+# extensions of the movies picked up from a directory
+extensions = ('.mp4', '.avi', '.mov', '.mkv')
+
+def find_movies(inputs):
+    """Finds the movies to rotate.
+
+    Parameters
+    ----------
+    inputs : list
+        Directories, glob patterns or paths of movies.
+
+    Returns
+    -------
+    list
+        The sorted paths of the movies, without rotated movies.
+    """
+    movies = set()
+    for item in inputs:
+        if os.path.isdir(item):
+            paths = [os.path.join(item, name) for name in os.listdir(item)]
+        else:
+            paths = glob.glob(item)
+        movies.update(p for p in paths
+                      if p.lower().endswith(extensions)
+                      and not p[:-4].endswith('-rot'))
+    return sorted(movies)
+
+def output_path(movie, out):
+    """Finds the path of the rotated movie in the output directory."""
+    name = os.path.basename(movie)[:-4]
+    return os.path.join(out, name + '-rot.mp4')
+
+def up_to_date(movie, output, settings, previous):
+    """Checks if a movie was already rotated with the same settings.
+
+    Parameters
+    ----------
+    movie : str
+        The path of the movie.
+    output : str
+        The path of the rotated movie.
+    settings : dict
+        The settings the movie will be rotated with.
+    previous : dict
+        The entry of the movie in the last report, or None.
+
+    Returns
+    -------
+    bool
+        True if the rotated movie can be kept.
+    """
+    if previous is None or previous['status'] == 'failed':
+        return False
+    if not os.path.exists(output):
+        return False
+    if os.path.getmtime(output) < os.path.getmtime(movie):
+        return False
+    return (previous['settings'] == settings
+            and previous['input'] == frameindex.stamp(movie))
+
+def rotate_movie(movie, output, settings):
+    """Rotates a single movie. This is run in a worker process.
+
+    Parameters
+    ----------
+    movie : str
+        The path of the movie.
+    output : str
+        The path of the rotated movie.
+    settings : dict
+        The keyword arguments given to digipyro.digi_rotate, and 'auto' with
+        'auto_threshold' to detect the area of interest.
+
+    Returns
+    -------
+    dict
+        The entry of the movie in the report.
+    """
+    settings = dict(settings)
+    auto = settings.pop('auto')
+    threshold = settings.pop('auto_threshold')
+    entry = {'movie': movie, 'output': output,
+             'input': frameindex.stamp(movie)}
+
+    begin = time.perf_counter()
+    try:
+        if auto:
+            # detect here, so a failed detection never opens a window
+            vid = cv2.VideoCapture(movie)
+            start = int(vid.get(cv2.CAP_PROP_FPS) * settings['t0'])
+            frames = detect.sample_frames(vid, start, 5, 10)
+            vid.release()
+            center, r, confidence = detect.detect_circle(frames)
+            if confidence < threshold:
+                raise RuntimeError('rim detection is not confident '
+                                   '({:.2f})'.format(confidence))
+            settings['center'] = center
+            settings['radius'] = r
+
+        frames = digipyro.digi_rotate(path=movie, output=output, **settings)
+    except Exception as err:
+        entry.update(status='failed', error=str(err))
+        return entry
+
+    seconds = time.perf_counter() - begin
+    entry.update(status='rotated', seconds=seconds, frames=frames,
+                 fps=frames / seconds)
+    return entry
+
+def run_batch(movies, out, settings, jobs=1, force=False):
+    """Rotates several movies in parallel and writes a report.
+
+    Parameters
+    ----------
+    movies : list
+        The paths of the movies.
+    out : str
+        The directory the rotated movies and the report are saved in.
+    settings : dict
+        The settings shared by every movie, see rotate_movie.
+    jobs : int
+        The number of movies rotated at the same time.
+    force : bool
+        If True, movies that are up to date are rotated again.
+
+    Returns
+    -------
+    list
+        The entries of the report, one per movie.
+    """
+    os.makedirs(out, exist_ok=True)
+    report = os.path.join(out, 'report.json')
+
+    previous = {}
+    if os.path.exists(report):
+        with open(report) as f:
+            previous = {entry['movie']: entry for entry in json.load(f)}
+
+    entries = []
+    todo = []
+    for movie in movies:
+        output = output_path(movie, out)
+        last = previous.get(movie)
+        if not force and up_to_date(movie, output, settings, last):
+            entries.append(dict(last, status='skipped'))
+            print('[skipped] {}'.format(movie))
+        else:
+            todo.append((movie, output))
+
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(rotate_movie, movie, output, settings)
+                   for movie, output in todo]
+        for n, job in enumerate(as_completed(futures), 1):
+            entry = job.result()
+            entry['settings'] = settings
+            entries.append(entry)
+
+            if entry['status'] == 'failed':
+                print('[{}/{}] {}: failed, {}'.format(n, len(todo),
+                                                     entry['movie'],
+                                                     entry['error']))
+            else:
+                print('[{}/{}] {}: {:.1f} s, {:.1f} fps'.format(
+                    n, len(todo), entry['movie'], entry['seconds'],
+                    entry['fps']))
+
+    entries.sort(key=lambda entry: entry['movie'])
+    with open(report, 'w') as f:
+        json.dump(entries, f, indent=2)
+    return entries
+
+# module runs on CLI if run on its own
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    if (args.center is None or args.radius is None) and args.roi is None \
+       and not args.auto:
+        parser.error('give the area of interest with --center and --radius, '
+                     '--roi or --auto')
+
+    # the settings are kept as JSON types, so they compare equal to the ones
+    # read back from the report
+    center = args.center and list(args.center)
+    settings = {'t0': args.t0, 't1': args.t1, 'rpm': args.rpm,
+                'crop': args.crop, 'workers': args.workers,
+                'center': center, 'radius': args.radius,
+                'roi': args.roi, 'auto': args.auto,
+                'auto_threshold': args.auto_threshold}
+
+    run_batch(find_movies(args.inputs), args.out, settings, args.jobs,
+              args.force)
@@ -0,0 +1,423 @@
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+
+import digipyro
+import interaction as interact
+import polar
+import synth
+#------------------------------------------------------------------------------
+# *** COMMAND LINE INTERFACE SETUP ***
+# initial message for program
+msg = """ This program measures how fast movies are synthesized and rotated.
+Fixture movies of the paraboloid are made at each size and length, then
+rotated one stage at a time (decode, mask, warp, encode), with the polar
+engine, and end to end with digi_rotate. The frame rates and peak memory are
+saved as JSON, which can be compared with an earlier run. Nothing is
+downloaded."""
+fmt = argparse.ArgumentDefaultsHelpFormatter
+parser = argparse.ArgumentParser(description=msg,
+                                 formatter_class=fmt)
+
+# the frame sizes of the fixtures
+sizes = {'480p': (854, 480), '1080p': (1920, 1080), '4k': (3840, 2160)}
+
+# collecting arguments for the user to change
+parser.add_argument('-s', '--sizes', type=str, nargs='+',
+                    default=list(sizes), choices=list(sizes),
+                    help='The frame sizes of the fixture movies.')
+
+parser.add_argument('-t', '--seconds', type=float, nargs='+', default=[2],
+                    help='The lengths of the fixture movies in seconds.')
+
+parser.add_argument('-f', '--fps', type=float, default=30,
+                    help='The frame rate of the fixture movies.')
+
+parser.add_argument('--rpm', type=float, default=10,
+                    help='The digital rotation given to the fixtures.')
+
+parser.add_argument('--workers', type=int, default=1,
+                    help='The number of threads used by digi_rotate.')
+
+parser.add_argument('-d', '--dir', type=str, default='bench-fixtures',
+                    help='The directory the fixtures are written to.')
+
+parser.add_argument('-o', '--output', type=str, default='bench.json',
+                    help='The JSON file the results are saved in.')
+
+parser.add_argument('--compare', type=str, default=None,
+                    help='An earlier results file to compare the run with.')
+#------------------------------------------------------------------------------
+
+# the puck of the fixtures, which stays on the surface
+fixture_params = {'omega': 2*np.pi*10/60, 'u0': 1, 'v0': 0, 'x0': 1,
+                  'radius': 2}
+
+def peak_rss():
+    """Finds the peak memory of this process [MB]."""
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def rates(frames, seconds):
+    """Finds the frame rate of each stage from the time it took."""
+    return {stage: frames / t if t > 0 else None
+            for stage, t in seconds.items()}
+
+def fixture_roi(dim):
+    """Finds the rim drawn by synth.render_paraboloid, which is a circle of a
+    third of the smaller side at the middle of the frame."""
+    return (dim[0] // 2, dim[1] // 2), min(dim) / 3
+
+def bench_synth(path, seconds, fps, dim):
+    """Makes a fixture movie, timing the drawing and the encoding.
+
+    Parameters
+    ----------
+    path : str
+        The file name of the fixture.
+    seconds : float
+        The length of the fixture [s].
+    fps : float
+        The frame rate of the fixture.
+    dim : tuple
+        The (width, height) of the fixture.
+
+    Returns
+    -------
+    dict
+        The frames, the time of each stage [s] and their frame rates.
+    """
+    frames = synth.render_paraboloid(seconds, fps=fps, dim=dim,
+                                     **fixture_params)
+    fourcc = cv2.VideoWriter_fourcc('m', 'p', '4', 'v')
+    video_writer = cv2.VideoWriter(path, fourcc, fps, dim)
+
+    stages = {'draw': 0, 'encode': 0}
+    count = 0
+    while True:
+        start = time.perf_counter()
+        frame = next(frames, None)
+        stages['draw'] += time.perf_counter() - start
+        if frame is None:
+            break
+
+        start = time.perf_counter()
+        video_writer.write(frame)
+        stages['encode'] += time.perf_counter() - start
+        count += 1
+
+    start = time.perf_counter()
+    video_writer.release()
+    stages['encode'] += time.perf_counter() - start
+
+    total = sum(stages.values())
+    return {'frames': count, 'seconds': stages,
+            'fps': rates(count, stages), 'total_fps': count / total}
+
+def bench_stages(path, output, rpm):
+    """Rotates a fixture one stage at a time on a single thread, timing each
+    stage of digi_rotate separately.
+
+    Parameters
+    ----------
+    path : str
+        The file name of the fixture.
+    output : str
+        The file name of the rotated fixture.
+    rpm : float
+        The digital rotation [rotations per min].
+
+    Returns
+    -------
+    dict
+        The frames, the time of each stage [s] and their frame rates.
+    """
+    vid = cv2.VideoCapture(path)
+    fps = vid.get(cv2.CAP_PROP_FPS)
+    dim = (int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)),
+           int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    center, radius = fixture_roi(dim)
+    _, poly, center, _ = interact.circle_roi(center, radius, dim)
+    mask, box = digipyro.prepare_mask(poly, dim)
+    dtheta = -1 * 6 * rpm / fps
+    video_writer = digipyro.open_writer(output, fps, dim)
+
+    stages = {'decode': 0, 'mask': 0, 'warp': 0, 'encode': 0}
+    count = 0
+    while True:
+        start = time.perf_counter()
+        ret, frame = vid.read()
+        stages['decode'] += time.perf_counter() - start
+        if not ret:
+            break
+
+        start = time.perf_counter()
+        frame = digipyro.mask_frame(frame, center, dim, mask, box)
+        stages['mask'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        frame = digipyro.warp_frame(frame, count*dtheta, center, dim, box)
+        stages['warp'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        video_writer.write(frame)
+        stages['encode'] += time.perf_counter() - start
+        count += 1
+
+    start = time.perf_counter()
+    video_writer.release()
+    stages['encode'] += time.perf_counter() - start
+    vid.release()
+
+    total = sum(stages.values())
+    return {'frames': count, 'seconds': stages,
+            'fps': rates(count, stages), 'total_fps': count / total}
+
+def bench_polar(path, output, rpm):
+    """Rotates a fixture with the polar engine one stage at a time, so it can
+    be compared with bench_stages.
+
+    Parameters
+    ----------
+    path : str
+        The file name of the fixture.
+    output : str
+        The file name of the rotated fixture.
+    rpm : float
+        The digital rotation [rotations per min].
+
+    Returns
+    -------
+    dict
+        The frames, the time of each stage [s] and their frame rates. The
+        rotation is split into unwrap, shift and wrap.
+    """
+    vid = cv2.VideoCapture(path)
+    fps = vid.get(cv2.CAP_PROP_FPS)
+    dim = (int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)),
+           int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    center, radius = fixture_roi(dim)
+    grid = polar.PolarGrid(center, radius, dim)
+    dtheta = -1 * 6 * rpm / fps
+    video_writer = digipyro.open_writer(output, fps, dim)
+
+    stages = {'decode': 0, 'unwrap': 0, 'shift': 0, 'wrap': 0, 'encode': 0}
+    count = 0
+    while True:
+        start = time.perf_counter()
+        ret, frame = vid.read()
+        stages['decode'] += time.perf_counter() - start
+        if not ret:
+            break
+
+        start = time.perf_counter()
+        frame = grid.unwrap(frame)
+        stages['unwrap'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        frame = grid.rotate(frame, count*dtheta)
+        stages['shift'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        frame = grid.wrap(frame)
+        stages['wrap'] += time.perf_counter() - start
+
+        start = time.perf_counter()
+        video_writer.write(frame)
+        stages['encode'] += time.perf_counter() - start
+        count += 1
+
+    start = time.perf_counter()
+    video_writer.release()
+    stages['encode'] += time.perf_counter() - start
+    vid.release()
+
+    total = sum(stages.values())
+    return {'frames': count, 'seconds': stages,
+            'fps': rates(count, stages), 'total_fps': count / total}
+
+def bench_rotate(path, output, rpm, workers=1):
+    """Rotates a fixture with digi_rotate, timing it end to end.
+
+    Parameters
+    ----------
+    path : str
+        The file name of the fixture.
+    output : str
+        The file name of the rotated fixture.
+    rpm : float
+        The digital rotation [rotations per min].
+    workers : int
+        The number of threads used by digi_rotate.
+
+    Returns
+    -------
+    dict
+        The frames, the time [s] and the frame rate.
+    """
+    vid = cv2.VideoCapture(path)
+    dim = (int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)),
+           int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    vid.release()
+    center, radius = fixture_roi(dim)
+
+    start = time.perf_counter()
+    count = digipyro.digi_rotate(0, 0, rpm, path, workers=workers,
+                                 center=center, radius=radius,
+                                 output=output)
+    total = time.perf_counter() - start
+    return {'frames': count, 'seconds': total, 'total_fps': count / total}
+
+def bench_case(size, seconds, fps, rpm, workers, directory):
+    """Runs every benchmark of one fixture. This is run in a fresh process so
+    the peak memory belongs to the fixture alone.
+
+    Parameters
+    ----------
+    size : str
+        The name of the frame size, a key of sizes.
+    seconds : float
+        The length of the fixture [s].
+    fps : float
+        The frame rate of the fixture.
+    rpm : float
+        The digital rotation [rotations per min].
+    workers : int
+        The number of threads used by digi_rotate.
+    directory : str
+        The directory the fixtures are written to.
+
+    Returns
+    -------
+    dict
+        The results of the fixture.
+    """
+    dim = sizes[size]
+    name = os.path.join(directory, 'fixture-{}-{:g}s'.format(size, seconds))
+
+    case = {'size': size, 'dim': list(dim), 'seconds': seconds, 'fps': fps}
+    case['synth'] = bench_synth(name + '.mp4', seconds, fps, dim)
+    case['stages'] = bench_stages(name + '.mp4', name + '-stages.mp4', rpm)
+    case['polar'] = bench_polar(name + '.mp4', name + '-polar.mp4', rpm)
+    case['rotate'] = bench_rotate(name + '.mp4', name + '-rot.mp4', rpm,
+                                  workers)
+    case['peak_rss_mb'] = peak_rss()
+    return case
+
+def machine():
+    """Describes the machine, so runs on different machines are not
+    mistaken for a change in speed."""
+    return {'platform': platform.platform(),
+            'processor': platform.processor(),
+            'cpus': os.cpu_count(),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'opencv': cv2.__version__}
+
+def run_bench(cases, directory, fps=30, rpm=10, workers=1):
+    """Runs the benchmarks of every fixture, one at a time.
+
+    Parameters
+    ----------
+    cases : list
+        The (size, seconds) of each fixture.
+    directory : str
+        The directory the fixtures are written to.
+    fps : float
+        The frame rate of the fixtures.
+    rpm : float
+        The digital rotation [rotations per min].
+    workers : int
+        The number of threads used by digi_rotate.
+
+    Returns
+    -------
+    dict
+        The machine and the results of every fixture.
+    """
+    os.makedirs(directory, exist_ok=True)
+
+    # a fresh process for each fixture keeps their peak memory apart
+    context = multiprocessing.get_context('spawn')
+    results = []
+    for size, seconds in cases:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results.append(pool.submit(bench_case, size, seconds, fps, rpm,
+                                       workers, directory).result())
+    return {'machine': machine(), 'rpm': rpm, 'workers': workers,
+            'cases': results}
+
+def compare(report, previous):
+    """Prints the change in frame rate of every stage from an earlier run.
+
+    Parameters
+    ----------
+    report : dict
+        The results of this run.
+    previous : dict
+        The results of the earlier run.
+    """
+    if previous['machine'] != report['machine']:
+        print('The earlier run was on a different machine.')
+
+    old = {(case['size'], case['seconds']): case
+           for case in previous['cases']}
+    for case in report['cases']:
+        key = (case['size'], case['seconds'])
+        if key not in old:
+            continue
+        rows = [('synth', case['synth']['total_fps'],
+                 old[key]['synth']['total_fps']),
+                ('rotate', case['rotate']['total_fps'],
+                 old[key]['rotate']['total_fps'])]
+        for stage, new_fps in case['stages']['fps'].items():
+            rows.append((stage, new_fps, old[key]['stages']['fps'][stage]))
+        if 'polar' in old[key]:
+            for stage, new_fps in case['polar']['fps'].items():
+                rows.append(('polar ' + stage, new_fps,
+                             old[key]['polar']['fps'][stage]))
+
+        print('{} {:g}s'.format(*key))
+        for stage, new_fps, old_fps in rows:
+            if new_fps and old_fps:
+                print('  {:12s} {:9.1f} fps  {:+6.1f}%'.format(
+                    stage, new_fps, 100 * (new_fps / old_fps - 1)))
+
+# module runs on CLI if run on its own
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    cases = [(size, seconds) for size in args.sizes
+             for seconds in args.seconds]
+    report = run_bench(cases, args.dir, args.fps, args.rpm, args.workers)
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    for case in report['cases']:
+        print('{} {:g}s: synth {:.1f} fps, rotate {:.1f} fps, '
+              'peak {:.0f} MB'.format(case['size'], case['seconds'],
+                                      case['synth']['total_fps'],
+                                      case['rotate']['total_fps'],
+                                      case['peak_rss_mb']))
+        # the rotation itself, without decoding and encoding
+        affine = case['stages']['seconds']
+        unwrapped = case['polar']['seconds']
+        warp = (affine['mask'] + affine['warp']) / case['stages']['frames']
+        shift = (unwrapped['unwrap'] + unwrapped['shift']) / case['polar'][
+            'frames']
+        wrap = unwrapped['wrap'] / case['polar']['frames']
+        print('  affine {:.1f} ms/frame, polar {:.1f} ms/frame unwrapped '
+              'or {:.1f} ms/frame wrapped back'.format(
+                  1000 * warp, 1000 * shift, 1000 * (shift + wrap)))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
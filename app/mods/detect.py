@@ -0,0 +1,186 @@
+import cv2
+import numpy as np
+
+import interaction as interact
+
+
+def sample_frames(video, start, samples, stride):
+    """Reads a few frames of the film, spaced apart from each other.
+
+    Parameters
+    ----------
+    video : Object
+        The opened film.
+    start : int
+        The first frame to be read.
+    samples : int
+        The number of frames to read.
+    stride : int
+        The number of frames between each sample.
+
+    Returns
+    -------
+    list
+        The frames that could be read.
+    """
+    frames = []
+    for k in range(samples):
+        video.set(cv2.CAP_PROP_POS_FRAMES, start + k * stride)
+        ret, frame = video.read()
+        if not ret:
+            break
+        frames.append(frame)
+    return frames
+
+def rim_score(edges, xc, yc, r):
+    """Scores how well a circle follows the edges of an image.
+
+    Parameters
+    ----------
+    edges : array_like
+        The edge map of the image, non-zero on the edges.
+    xc, yc, r : float
+        The center and radius of the circle.
+
+    Returns
+    -------
+    float
+        The fraction of the circle that lies on an edge, between 0 and 1.
+    """
+    theta = np.linspace(0, 2 * np.pi, 360, endpoint=False)
+    x = np.round(xc + r * np.cos(theta)).astype(int)
+    y = np.round(yc + r * np.sin(theta)).astype(int)
+
+    # points off the image count against the circle
+    inside = (x >= 0) & (x < edges.shape[1]) & (y >= 0) & (y < edges.shape[0])
+    hits = edges[y[inside], x[inside]] > 0
+    return hits.sum() / len(theta)
+
+def detect_circle(frames, width=640):
+    """Finds the rim of the rotating tank with the Hough transform. The frames
+    are averaged and downscaled first, which hides anything moving on the
+    tank and keeps the detection fast for large films, and the circle found
+    is then refined with the edges of the full frames.
+
+    Parameters
+    ----------
+    frames : list
+        The frames to detect the rim in.
+    width : int
+        The width the frames are downscaled to before detecting.
+
+    Returns
+    -------
+    center : tuple
+        The center of the rim in pixels of the original frames.
+    r : float
+        The radius of the rim in pixels of the original frames.
+    confidence : float
+        The fraction of the rim found on an edge, between 0 and 1. This is 0
+        if no circle was found.
+    """
+    height, full = frames[0].shape[:2]
+    scale = min(width / full, 1.0)
+    size = (int(round(full * scale)), int(round(height * scale)))
+
+    small = [cv2.cvtColor(cv2.resize(frame, size,
+                                     interpolation=cv2.INTER_AREA),
+                          cv2.COLOR_BGR2GRAY) for frame in frames]
+    gray = np.median(np.stack(small), axis=0).astype(np.uint8)
+    gray = cv2.GaussianBlur(gray, (5, 5), 0)
+
+    shortest = min(size)
+    circles = cv2.HoughCircles(gray, cv2.HOUGH_GRADIENT, dp=1,
+                               minDist=shortest // 4, param1=100,
+                               param2=30, minRadius=shortest // 5,
+                               maxRadius=int(max(size) * 0.6))
+    if circles is None:
+        return (full // 2, height // 2), 0, 0.0
+
+    # keep the candidate that best follows the edges of the image
+    edges = cv2.dilate(cv2.Canny(gray, 50, 100), np.ones((3, 3), np.uint8))
+    scores = [rim_score(edges, *circle) for circle in circles[0]]
+    best = int(np.argmax(scores))
+    xc, yc, r = circles[0][best] / scale
+
+    # the circle is only as good as a pixel of the downscaled frames, so it
+    # is fitted again to the edges of the full frames close to it
+    xc, yc, r = refine_circle(frames, xc, yc, r, band=2 / scale + 2)
+
+    # the circle is only rounded once, here
+    return ((int(round(xc)), int(round(yc))), float(round(r)),
+            float(scores[best]))
+
+def refine_circle(frames, xc, yc, r, band):
+    """Fits a circle to the edges of the full frames within a thin band
+    around a circle found at a lower resolution.
+
+    Parameters
+    ----------
+    frames : list
+        The frames the circle was found in.
+    xc, yc, r : float
+        The center and radius of the circle in pixels of the frames.
+    band : float
+        The largest distance of an edge from the circle to be fitted [px].
+
+    Returns
+    -------
+    xc, yc, r : float
+        The circle fitted with interaction.fit_circle, or the circle given
+        if too few edges are close to it.
+    """
+    height, width = frames[0].shape[:2]
+    # only the square around the circle is needed
+    x0 = max(int(xc - r - band), 0)
+    y0 = max(int(yc - r - band), 0)
+    x1 = min(int(xc + r + band) + 1, width)
+    y1 = min(int(yc + r + band) + 1, height)
+
+    gray = [cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+            for frame in frames]
+    gray = np.median(np.stack(gray), axis=0).astype(np.uint8)
+    edges = cv2.Canny(cv2.GaussianBlur(gray, (5, 5), 0), 50, 100)
+
+    y, x = np.nonzero(edges)
+    x = (x + x0).astype(np.float64)
+    y = (y + y0).astype(np.float64)
+    # the band follows the fit, as edges at its border are cut off on the
+    # side the first circle is off towards
+    for _ in range(3):
+        near = np.abs(np.hypot(x - xc, y - yc) - r) < band
+        if near.sum() < 20:
+            break
+        xc, yc, r = interact.fit_circle(x[near], y[near])
+    return xc, yc, r
+
+def detect_roi(video, dim, start, samples=5, stride=10):
+    """Finds the area of interest without user interaction.
+
+    Parameters
+    ----------
+    video : Object
+        The opened film.
+    dim : tuple
+        The (width, height) of the frames.
+    start : int
+        The first frame to look at.
+    samples : int
+        The number of frames averaged together before detecting.
+    stride : int
+        The number of frames between each sample.
+
+    Returns
+    -------
+    poly1, poly2, center, r
+        The same values returned by interaction.selection_window.
+    confidence : float
+        The fraction of the rim found on an edge, between 0 and 1.
+    """
+    frames = sample_frames(video, start, samples, stride)
+    frames = [frame if frame.shape[1::-1] == dim else
+              cv2.resize(frame, dim, interpolation=cv2.INTER_CUBIC)
+              for frame in frames]
+
+    center, r, confidence = detect_circle(frames)
+    return interact.circle_roi(center, r, dim), confidence
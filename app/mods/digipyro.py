@@ -1,9 +1,25 @@
 import argparse
+import contextlib
+import functools
+import itertools
+import os
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
 import cv2
 import numpy as np
 
+import detect
+import encoder
+import estimate as est
+import framecache
+import frameindex
 import interaction as interact
+import pipeline
+import polar
+import telemetry
+import tracking
 #------------------------------------------------------------------------------
 # *** COMMAND LINE INTERFACE SETUP ***
 # initial message for program
@@ -12,6 +28,12 @@ the synthetic program as well as other movies to rotate and place the user in
 the rotating frame. The user may input several variables and will need to
 select an area of interest, so the program rotates about the correct axis."""
 fmt = argparse.ArgumentDefaultsHelpFormatter
+
+def point(text):
+    """Reads a point given as 'X,Y' on the command line."""
+    x, y = text.split(',')
+    return float(x), float(y)
+
 parser = argparse.ArgumentParser(description=msg,
                                  formatter_class=fmt)
 
@@ -20,31 +42,896 @@ parser.add_argument('--t0', type=float, default=0,
                     help='The start time for the digital rotation.')
 
 parser.add_argument('--t1', type=float, default=0,
-                    help=('The end time for the digital rotation. ',
-                          'If left to default, it will go through the entire ',
+                    help=('The end time for the digital rotation. '
+                          'If left to default, it will go through the entire '
                           'film.'))
 
-parser.add_argument('--rpm', type=float, default=10,
-                   help=('The digital rotation given to the movie. This ',
-                         'rotation will be subtracted from the rotation of ',
-                         'the film and is consistent with a right-handed ',
-                         'frame of reference.'))
+parser.add_argument('--rpm', type=float, nargs='+', default=[10],
+                   help=('The digital rotation given to the movie. This '
+                         'rotation will be subtracted from the rotation of '
+                         'the film and is consistent with a right-handed '
+                         'frame of reference. Several values make one movie '
+                         'for each, from a single pass over the film.'))
 
 parser.add_argument('--path', type=str, required=True,
-                    help=('The complete path of the movie being inputted.',
-                          'The output will be saved in the same directory of ',
+                    help=('The complete path of the movie being inputted. '
+                          'The output will be saved in the same directory of '
                           'where this movie is located.'))
+
+parser.add_argument('--crop', action='store_true',
+                    help=('Crop each frame to the square around the selected '
+                          'circle before rotating it, so pixels outside of '
+                          'the area of interest are never resampled.'))
+
+parser.add_argument('--workers', type=int, default=1,
+                    help=('The number of threads that rotate frames. With '
+                          'more than one, decoding, rotating and writing '
+                          'run at the same time.'))
+
+parser.add_argument('--processes', type=int, default=1,
+                    help=('The number of processes the film is split '
+                          'between. Each process rotates its own segment and '
+                          'the segments are joined with ffmpeg at the end.'))
+
+parser.add_argument('--center', type=point, default=None,
+                    help=('The axis of rotation as X,Y in pixels. Together '
+                          'with --radius this skips the selection window.'))
+
+parser.add_argument('--radius', type=float, default=None,
+                    help='The radius of the area of interest in pixels.')
+
+parser.add_argument('--roi', type=str, default=None,
+                    help=('A JSON file with the area of interest, either the '
+                          'clicked "points" or a "center" and "radius". This '
+                          'skips the selection window.'))
+
+parser.add_argument('--save-roi', type=str, default=None,
+                    help=('Save the points clicked in the selection window '
+                          'to this JSON file, so it can be given to --roi.'))
+
+parser.add_argument('--auto', action='store_true',
+                    help=('Detect the rim of the tank automatically instead '
+                          'of opening the selection window. The window is '
+                          'still opened if the detection is not confident.'))
+
+parser.add_argument('--auto-threshold', type=float, default=0.5,
+                    help=('The confidence, between 0 and 1, the automatic '
+                          'detection needs to be used.'))
+
+parser.add_argument('--output', type=str, default=None,
+                    help=('The path of the rotated movie. By default it is '
+                          'saved next to the movie with a -rot ending.'))
+
+parser.add_argument('--track', type=str, default=None,
+                    help=('Track a single particle while rotating and save '
+                          'its trajectory in the lab and rotating frames to '
+                          'this file (.csv or .npy). With --processes, each '
+                          'segment is tracked on its own, starting with a '
+                          'search of the whole frame, and --track-background '
+                          'cannot be used.'))
+
+parser.add_argument('--track-threshold', type=int, default=200,
+                    help=('The gray level that separates the particle from '
+                          'the background when tracking.'))
+
+parser.add_argument('--track-window', type=int, default=50,
+                    help=('The half-width in pixels of the area searched '
+                          'around the last position of the particle.'))
+
+parser.add_argument('--track-background', action='store_true',
+                    help=('Subtract a running background, started from the '
+                          'median of the first frames, before thresholding '
+                          'when tracking. It needs a single process.'))
+
+parser.add_argument('--codec', type=str, default='mp4v',
+                    help=('The codec of the rotated movie. mp4v is written '
+                          'by OpenCV; anything else, such as libx264 or '
+                          'libx265, is encoded by piping frames to ffmpeg.'))
+
+parser.add_argument('--crf', type=int, default=23,
+                    help=('The quality of the ffmpeg codec, lower is better '
+                          'and gives larger files.'))
+
+parser.add_argument('--preset', type=str, default='medium',
+                    help=('The speed of the ffmpeg codec, from ultrafast for '
+                          'previews to veryslow for archives.'))
+
+parser.add_argument('--lossless', action='store_true',
+                    help=('Store the frames exactly with ffmpeg, for an '
+                          'intermediate movie that is processed further.'))
+
+parser.add_argument('--index', action='store_true',
+                    help=('Find the frames between --t0 and --t1 and the '
+                          'angle of each frame from the time stamp of every '
+                          'frame, which is exact for NTSC and variable frame '
+                          'rate movies. The index is built once and cached '
+                          'beside the movie.'))
+
+parser.add_argument('--preview', action='store_true',
+                    help=('Quickly preview the rotation to tune --rpm: only '
+                          'every --preview-step frame is rotated, at '
+                          '--preview-scale of the size and with a cheaper '
+                          'interpolation, and shown in a window.'))
+
+parser.add_argument('--preview-step', type=int, default=4,
+                    help='The preview rotates one of every this many frames.')
+
+parser.add_argument('--preview-scale', type=float, default=0.5,
+                    help='The size of the preview relative to the movie.')
+
+parser.add_argument('--proxy', action='store_true',
+                    help=('Save the preview as a small -preview movie '
+                          'instead of showing it in a window.'))
+
+parser.add_argument('--estimate', action='store_true',
+                    help=('Estimate the rotation rate from the footage '
+                          'between --t0 and --t1 and print it, instead of '
+                          'rotating the movie.'))
+
+parser.add_argument('--engine', type=str, default='affine',
+                    choices=['affine', 'polar'],
+                    help=('How frames are rotated: affine warps each frame '
+                          'once, polar unwraps the area of interest and '
+                          'shifts it along the angle.'))
+
+parser.add_argument('--unwrapped', action='store_true',
+                    help=('Keep the rotated movie in polar coordinates, '
+                          'with one row per angle and one column per '
+                          'radius, for analysis. This uses the polar '
+                          'engine.'))
+
+parser.add_argument('--cache', type=str, default=None,
+                    help=('A directory that keeps the decoded and masked '
+                          'frames, so re-running with another --rpm, engine '
+                          'or codec skips decoding the movie.'))
+
+parser.add_argument('--cache-size', type=float, default=20,
+                    help=('The largest size of the cache in GB. The least '
+                          'recently used movies are removed first.'))
+
+parser.add_argument('--array', action='store_true',
+                    help=('Also write the rotated frames to a memory-mapped '
+                          '.npy file beside the movie, with the time and '
+                          'angle of each frame in a -meta.npz file. An '
+                          '--output ending in .npy writes only the array.'))
+
+parser.add_argument('--array-gray', action='store_true',
+                    help='Store the array in grayscale.')
+
+parser.add_argument('--array-crop', action='store_true',
+                    help=('Only store the square around the area of '
+                          'interest in the array.'))
+
+parser.add_argument('--progress', action='store_true',
+                    help=('Show the frames written, the frame rate and the '
+                          'time left while rotating, and the time taken by '
+                          'each stage at the end.'))
 #------------------------------------------------------------------------------
 
-# collecting user input into list
-args = parser.parse_args()
+def read_frames(vid, frames, step=1):
+    """Reads frames from the film.
+
+    Parameters
+    ----------
+    vid : Object
+        The opened film.
+    frames : int
+        The maximum number of frames to read from.
+    step : int
+        Only every step-th frame is read; the ones in between are grabbed
+        without being converted.
+
+    Yields
+    ------
+    array_like
+        The next frame of the film.
+    """
+    for i in range(frames):
+        if i % step:
+            if not vid.grab():
+                return
+            continue
+        ret, frame = vid.read()
+        if not ret:
+            return
+        yield frame
+
+def resize_frame(frame, dim, interpolation=cv2.INTER_CUBIC):
+    """Resizes a frame to the size of the output, if it is not already.
+
+    Parameters
+    ----------
+    frame : array_like
+        The frame read from the film.
+    dim : tuple
+        The (width, height) of the output frame.
+    interpolation : int
+        The interpolation used when the frame has to be resized.
+
+    Returns
+    -------
+    array_like
+        The frame at the size of the output.
+    """
+    if frame.shape[1::-1] != dim:
+        frame = cv2.resize(frame, dim, interpolation=interpolation)
+    return frame
+
+def crop_frame(frame, dim, mask, box, interpolation=cv2.INTER_CUBIC):
+    """Resizes, crops and masks a single frame, which is the part of the work
+    that does not depend on the rotation. These are the frames the cache
+    keeps and the polar engine unwraps.
+
+    Parameters
+    ----------
+    frame : array_like
+        The frame read from the film.
+    dim : tuple
+        The (width, height) of the output frame.
+    mask : array_like
+        The mask of the area of interest, already cropped to the box. If
+        None, nothing is blacked out.
+    box : tuple
+        The (x0, y0, x1, y1) box the frame is cropped to before rotating.
+    interpolation : int
+        The interpolation used when the frame has to be resized.
+
+    Returns
+    -------
+    array_like
+        The masked frame, cropped to the box.
+    """
+    x0, y0, x1, y1 = box
+    frame = resize_frame(frame, dim, interpolation)
+
+    # blackout region outside, only keeping the cropped area
+    frame = frame[y0:y1, x0:x1]
+    if mask is not None:
+        return cv2.bitwise_and(frame, frame, mask=mask)
+    return frame.copy()
+
+def mark_center(frame, center, box):
+    """Draws the axis of rotation on a frame cropped to the box, in place."""
+    cv2.circle(frame, (center[0] - box[0], center[1] - box[1]), 4,
+               (255,0,0), -1)
+    return frame
+
+def mask_frame(frame, center, dim, mask, box, interpolation=cv2.INTER_CUBIC):
+    """Crops and masks a single frame with crop_frame and marks the axis of
+    rotation on it.
+
+    Parameters
+    ----------
+    frame : array_like
+        The frame read from the film.
+    center : tuple
+        The axis of rotation.
+    dim, mask, box, interpolation
+        See crop_frame.
+
+    Returns
+    -------
+    array_like
+        The masked frame, cropped to the box.
+    """
+    frame = crop_frame(frame, dim, mask, box, interpolation)
+    return mark_center(frame, center, box)
+
+def warp_frame(frame, angle, center, dim, box):
+    """Rotates and re-centers a frame made by mask_frame in a single warp.
+
+    Parameters
+    ----------
+    frame : array_like
+        The masked frame, cropped to the box.
+    angle : float
+        The rotation angle of the frame [deg].
+    center, dim, box
+        See mask_frame.
+
+    Returns
+    -------
+    array_like
+        The rotated frame.
+    """
+    M = interact.rotation_matrix(center, angle, dim, box[:2])
+    return cv2.warpAffine(frame, M, dim)
+
+def transform_frame(frame, angle, center, dim, mask, box,
+                    interpolation=cv2.INTER_CUBIC):
+    """Masks, rotates and re-centers a single frame.
+
+    Parameters
+    ----------
+    frame : array_like
+        The frame read from the film.
+    angle : float
+        The rotation angle of the frame [deg].
+    center, dim, mask, box, interpolation
+        See mask_frame.
+
+    Returns
+    -------
+    array_like
+        The rotated frame.
+    """
+    frame = mask_frame(frame, center, dim, mask, box, interpolation)
+    return warp_frame(frame, angle, center, dim, box)
+
+def fan_out(frame, matrices, center, dim, mask, box, telemetry=None,
+            masked=False):
+    """Masks a frame once and rotates it by several matrices, so several
+    rotation rates can share the decoding and masking.
+
+    Parameters
+    ----------
+    frame : array_like
+        The frame read from the film.
+    matrices : array_like
+        The matrix made by interaction.rotation_matrix for each output.
+    center, dim, mask, box
+        See mask_frame.
+    telemetry : telemetry.Telemetry
+        If given, the resize, mask and warp are timed.
+    masked : bool
+        If True, the frame was already cropped and masked by crop_frame, as
+        the frames of the cache are, and only the axis is marked on a copy.
+
+    Returns
+    -------
+    list
+        The rotated frame for each angle.
+    """
+    if telemetry is None:
+        if masked:
+            frame = mark_center(frame.copy(), center, box)
+        else:
+            frame = mask_frame(frame, center, dim, mask, box)
+        return [cv2.warpAffine(frame, M, dim) for M in matrices]
+
+    if masked:
+        with telemetry.stage('mask'):
+            frame = mark_center(frame.copy(), center, box)
+    else:
+        with telemetry.stage('resize'):
+            frame = resize_frame(frame, dim)
+        with telemetry.stage('mask'):
+            frame = mask_frame(frame, center, dim, mask, box)
+    with telemetry.stage('warp'):
+        return [cv2.warpAffine(frame, M, dim) for M in matrices]
+
+def polar_fan_out(frame, angles, dim, grid, mask, box, unwrapped=False,
+                  telemetry=None, masked=False):
+    """Unwraps a frame once and rotates it by several angles in polar
+    coordinates, the alternative to fan_out.
+
+    Parameters
+    ----------
+    frame : array_like
+        The frame read from the film.
+    angles : array_like
+        The rotation angle for each output [deg].
+    dim : tuple
+        The (width, height) the frame is resized to.
+    grid : polar.PolarGrid
+        The remap tables of the area of interest, centered in the box.
+    mask, box
+        See crop_frame.
+    unwrapped : bool
+        If True, the rotated frames are kept in polar coordinates instead of
+        being wrapped back.
+    telemetry : telemetry.Telemetry
+        If given, the resize, mask, unwrap, warp and wrap are timed.
+    masked : bool
+        If True, the frame was already cropped and masked by crop_frame, as
+        the frames of the cache are.
+
+    Returns
+    -------
+    list
+        The rotated frame for each angle.
+    """
+    def stage(name):
+        if telemetry is None:
+            return contextlib.nullcontext()
+        return telemetry.stage(name)
+
+    # the cached and the decoded frames are unwrapped from the same masked
+    # frame, so the cache does not change the output
+    if not masked:
+        with stage('resize'):
+            frame = resize_frame(frame, dim)
+        with stage('mask'):
+            frame = crop_frame(frame, dim, mask, box)
+    with stage('unwrap'):
+        frame = grid.unwrap(frame)
+    with stage('warp'):
+        rotated = [grid.rotate(frame, angle) for angle in angles]
+    if unwrapped:
+        return rotated
+
+    with stage('wrap'):
+        rotated = [grid.wrap(frame) for frame in rotated]
+    # the axis of rotation is marked, as mask_frame does
+    for frame in rotated:
+        cv2.circle(frame, (dim[0] // 2, dim[1] // 2), 4, (255,0,0), -1)
+    return rotated
+
+def transform_all(frames, transform, workers=1):
+    """Lazily transforms frames, on several threads if asked to.
+
+    Parameters
+    ----------
+    frames : iterable
+        The frames to be transformed.
+    transform : function
+        Called as transform(i, frame) and returns the new frame.
+    workers : int
+        The number of transform threads.
+
+    Returns
+    -------
+    iterator
+        The transformed frames, in order.
+    """
+    if workers > 1:
+        return pipeline.imap(frames, transform, workers)
+    return (transform(i, frame) for i, frame in enumerate(frames))
+
+def prepare_mask(poly, dim, crop=False):
+    """Computes the mask of the area of interest and the box frames are
+    cropped to, once for the whole film.
+
+    Parameters
+    ----------
+    poly : array_like
+        The polygon that approximates the circle of interest.
+    dim : tuple
+        The (width, height) of the frames.
+    crop : bool
+        If True, the box is the bounding square of the circle, otherwise it
+        is the whole frame.
+
+    Returns
+    -------
+    mask : array_like
+        The mask, cropped to the box.
+    box : tuple
+        The (x0, y0, x1, y1) box.
+    """
+    mask = interact.circle_mask(poly, dim)
+    if crop:
+        x0, y0, x1, y1 = interact.bounding_box(poly, dim)
+    else:
+        x0, y0, x1, y1 = 0, 0, dim[0], dim[1]
+    return mask[y0:y1, x0:x1], (x0, y0, x1, y1)
+
+def rotation_schedule(stamps, rpms, center, dim, box):
+    """Plans the rotation of a whole film before it is read. The angle of each
+    frame comes from its time stamp rather than its position in the film, so
+    the rotation does not drift on NTSC or variable frame rate films.
+
+    Parameters
+    ----------
+    stamps : array_like
+        The time of each frame to be rotated [s].
+    rpms : list
+        The rotation of each output [rotations per min].
+    center, dim, box
+        See mask_frame.
+
+    Returns
+    -------
+    angles : array_like
+        The angle of each frame and output [deg], shape (frames, outputs).
+    matrices : array_like
+        The warp of each frame and output, shape (frames, outputs, 2, 3).
+    """
+    # the first frame is not rotated
+    elapsed = np.asarray(stamps, dtype=np.float64) - stamps[:1]
+    # the negative is for the right hand rule
+    # -1 * (360 deg / 1 rot) * (1 min / 60 sec) * rpm * t
+    angles = -1 * 6 * np.outer(elapsed, rpms)
+    return angles, interact.rotation_matrices(center, angles, dim, box[:2])
 
-t0 = args.t0
-t1 = args.t1
-rpm = args.rpm
-path = args.path
+def rotate_frames(frames, center, rpm, fps, radius=None, crop=False,
+                  workers=1):
+    """Lazily rotates any sequence of frames. This is the library form of
+    digi_rotate: nothing is read from or written to disk, so the frames can
+    come from any source and the rotated frames can be passed on to tracking,
+    a preview or an encoder of the caller's choice.
 
-def digi_rotate(t0, t1, rpm, path):
+    Parameters
+    ----------
+    frames : iterable
+        The frames to rotate, as BGR arrays of the same size.
+    center : tuple
+        The axis of rotation in pixels.
+    rpm : float
+        The rotation the film [rotations per min].
+    fps : float
+        The frame rate of the frames.
+    radius : float
+        If given, the area outside of this radius around the center is
+        blacked out.
+    crop : bool
+        If True, frames are cropped to the bounding square of the circle
+        before they are rotated. This needs the radius.
+    workers : int
+        The number of threads used to rotate frames.
+
+    Yields
+    ------
+    array_like
+        Each rotated frame, in order.
+    """
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        return
+    dim = first.shape[1::-1]
+    center = (int(center[0]), int(center[1]))
+
+    if radius is not None:
+        poly1, poly2, center, _ = interact.circle_roi(center, radius, dim)
+        mask, box = prepare_mask(poly2, dim, crop)
+    else:
+        mask, box = None, (0, 0, dim[0], dim[1])
+
+    # -1 * (360 deg / 1 rot) * (1 min / 60 sec) * rpm * fps
+    dtheta = -1 * 6 * rpm / fps
+
+    def transform(i, frame):
+        return transform_frame(frame, i*dtheta, center, dim, mask, box)
+
+    frames = itertools.chain([first], frames)
+    yield from transform_all(frames, transform, workers)
+
+def open_writer(output, fps, dim, codec='mp4v', crf=23, preset='medium',
+                lossless=False, array=None, count=None, gray=False, box=None,
+                offset=None):
+    """Opens the writer for a rotated film.
+
+    Parameters
+    ----------
+    output : str
+        The path of the film to be written. If None, only the array is.
+    fps : float
+        The frame rate of the film.
+    dim : tuple
+        The (width, height) of the film.
+    codec : str
+        mp4v is written with OpenCV; any other codec is encoded by ffmpeg.
+    crf, preset, lossless
+        The settings of the ffmpeg codec, see encoder.FFmpegWriter.
+    array : str
+        If given, the frames are also written to this .npy file.
+    count, gray, box, offset
+        The layout of the array, see encoder.ArrayWriter.
+
+    Returns
+    -------
+    Object
+        The opened writer, with write and release methods.
+    """
+    writers = []
+    if array is not None:
+        writers.append(encoder.ArrayWriter(array, dim, count, gray, box,
+                                           offset))
+
+    if output is None:
+        pass
+    elif codec != 'mp4v' or lossless:
+        writers.append(encoder.FFmpegWriter(output, fps, dim, codec, crf,
+                                            preset, lossless))
+    else:
+        # codecc and new film to be outputted
+        fourcc = cv2.VideoWriter_fourcc('m', 'p', '4', 'v')
+        writers.append(cv2.VideoWriter(output, fourcc, fps, dim))
+
+    if len(writers) == 1:
+        return writers[0]
+    return encoder.TeeWriter(writers)
+
+def write_frames(frames, transform, writes, workers=1, tracker=None,
+                 telemetry=None):
+    """Transforms and writes frames, on several threads if asked to.
+
+    Parameters
+    ----------
+    frames : iterable
+        The frames to be transformed.
+    transform : function
+        Called as transform(i, frame) and returns a new frame for each
+        output.
+    writes : list
+        The function that writes each output, called with the new frames in
+        order.
+    workers : int
+        The number of transform threads.
+    tracker : tracking.Tracker
+        If given, the particle is tracked in the frames of the first output,
+        in order.
+    telemetry : telemetry.Telemetry
+        If given, the reading, tracking and writing are timed and each frame
+        written is counted.
+
+    Returns
+    -------
+    int
+        The number of frames written to each output.
+    """
+    if telemetry is not None:
+        frames = telemetry.iterate('read', frames)
+
+    count = 0
+    for outputs in transform_all(frames, transform, workers):
+        if telemetry is None:
+            if tracker is not None:
+                tracker.update(outputs[0])
+            for write, frame in zip(writes, outputs):
+                write(frame)
+        else:
+            if tracker is not None:
+                with telemetry.stage('track'):
+                    tracker.update(outputs[0])
+            with telemetry.stage('write'):
+                for write, frame in zip(writes, outputs):
+                    write(frame)
+            telemetry.tick()
+        count += 1
+
+    if tracker is not None:
+        tracker.finish()
+    return count
+
+def rotate_segment(path, outputs, first, plan, rotate, dim, fps, workers=1,
+                   tracker=None, encoding=None, profile=False, arrays=None,
+                   offset=0):
+    """Rotates one segment of a film and writes it to its own files, one for
+    each rotation rate. This is run in a separate process for each segment.
+
+    Parameters
+    ----------
+    path : str
+        The path to the movie, or to the cache entry of its frames.
+    outputs : list
+        The paths of the segments to be written, one for each rotation step,
+        or None where only an array is written.
+    first : int
+        The frame of the film the segment starts at.
+    plan : array_like
+        The part of the schedule made by rotation_schedule for the segment,
+        one row per frame, so the rotation continues where the previous
+        segment stopped.
+    rotate : function
+        Called as rotate(frame, plan[i], telemetry=timer) and returns the
+        rotated frame for each output, see fan_out and polar_fan_out.
+    dim : tuple
+        The (width, height) of the segments.
+    fps : float
+        The frame rate of the film.
+    workers : int
+        The number of threads used within the segment.
+    tracker : tracking.Tracker
+        If given, the particle is tracked within the segment.
+    encoding : dict
+        The codec settings given to open_writer.
+    profile : bool
+        If True, the time of each stage of the segment is measured.
+    arrays : list
+        The .npy files made by encoder.allocate_array that each rotation
+        step is also written to, or None.
+    offset : int
+        The frame of the arrays the segment starts at.
+
+    Returns
+    -------
+    written : int
+        The number of frames written to each segment.
+    positions : list
+        The positions of the particle in the segment, or None if it is not
+        tracked.
+    stages : dict
+        The time of each stage [s], or None if it is not measured.
+    """
+    count = len(plan)
+    if path.endswith('.npy'):
+        vid = None
+        frames = framecache.read_entry(path, first, count)
+    else:
+        vid = cv2.VideoCapture(path)
+        vid.set(cv2.CAP_PROP_POS_FRAMES, first)
+        frames = read_frames(vid, count)
+
+    arrays = arrays or [None] * len(outputs)
+    writers = [open_writer(output, fps, dim, array=array, offset=offset,
+                           **(encoding or {}))
+               for output, array in zip(outputs, arrays)]
+    timer = telemetry.Telemetry(count) if profile else None
+
+    def transform(i, frame):
+        return rotate(frame, plan[i], telemetry=timer)
+
+    written = write_frames(frames, transform,
+                           [writer.write for writer in writers], workers,
+                           tracker, timer)
+
+    for writer in writers:
+        writer.release()
+    if vid is not None:
+        vid.release()
+    return written, tracker and tracker.positions, timer and timer.stages
+
+def concat_segments(segments, output):
+    """Joins the segments into one film with ffmpeg. The streams are copied,
+    so there is no loss in quality.
+
+    Parameters
+    ----------
+    segments : list
+        The paths of the segments, in order.
+    output : str
+        The path of the joined film.
+    """
+    # the concat demuxer reads the segments from a list file
+    listing = os.path.join(os.path.dirname(segments[0]), 'segments.txt')
+    with open(listing, 'w') as f:
+        for segment in segments:
+            f.write("file '{}'\n".format(os.path.abspath(segment)))
+
+    subprocess.run(['ffmpeg', '-y', '-loglevel', 'error',
+                    '-f', 'concat', '-safe', '0', '-i', listing,
+                    '-c', 'copy', output], check=True)
+
+def show_frames(frames, fps, title='DigiPyRo preview'):
+    """Shows frames in a window at their frame rate. Pressing q or ESC closes
+    the window early.
+
+    Parameters
+    ----------
+    frames : iterable
+        The frames to show.
+    fps : float
+        The rate the frames are shown at.
+    title : str
+        The title of the window.
+
+    Returns
+    -------
+    int
+        The number of frames shown.
+    """
+    delay = max(int(1000 / fps), 1)
+    count = 0
+    for frame in frames:
+        cv2.imshow(title, frame)
+        count += 1
+        if cv2.waitKey(delay) & 0xFF in (ord('q'), 27):
+            break
+    cv2.destroyWindow(title)
+    return count
+
+def preview_rotate(vid, frames, angles, poly, center, dim, fps, crop=False,
+                   step=4, scale=0.5, workers=1, proxy=None, encoding=None):
+    """Rotates a quick, low quality preview of the film, so the rotation rate
+    can be tuned in seconds before the full movie is rendered.
+
+    Parameters
+    ----------
+    vid : Object
+        The opened film, at the first frame.
+    frames : int
+        The number of frames of the film to preview.
+    angles : array_like
+        The rotation angle of each frame of the film [deg].
+    poly : array_like
+        The polygon that approximates the circle of interest.
+    center : tuple
+        The axis of rotation.
+    dim : tuple
+        The (width, height) of the film.
+    fps : float
+        The frame rate of the film.
+    crop : bool
+        If True, frames are cropped to the circle before rotating.
+    step : int
+        Only every step-th frame is rotated.
+    scale : float
+        The size of the preview relative to the film.
+    workers : int
+        The number of threads used to rotate frames.
+    proxy : str
+        If given, the preview is saved to this path instead of shown.
+    encoding : dict
+        The codec settings given to open_writer for the proxy.
+
+    Returns
+    -------
+    int
+        The number of frames previewed.
+    """
+    # everything is scaled down, and the cheaper interpolation is used
+    small = (int(dim[0] * scale), int(dim[1] * scale))
+    pcenter = (int(center[0] * scale), int(center[1] * scale))
+    mask, box = prepare_mask(np.array(poly) * scale, small, crop)
+
+    def transform(i, frame):
+        return transform_frame(frame, angles[i*step], pcenter, small, mask,
+                               box, cv2.INTER_LINEAR)
+
+    rotated = transform_all(read_frames(vid, frames, step), transform,
+                            workers)
+    if proxy is None:
+        return show_frames(rotated, fps / step)
+
+    video_writer = open_writer(proxy, fps / step, small, **(encoding or {}))
+    count = 0
+    for frame in rotated:
+        video_writer.write(frame)
+        count += 1
+    video_writer.release()
+    return count
+
+def select_roi(vid, dim, start, center=None, radius=None, roi=None,
+               save_roi=None, auto=False, auto_threshold=0.5):
+    """Finds the area of interest. It is given directly by the center and
+    radius, read from a sidecar file, detected automatically, or else
+    selected in the selection window.
+
+    Parameters
+    ----------
+    vid : Object
+        The opened film.
+    dim : tuple
+        The (width, height) of the frames.
+    start : int
+        The frame shown in the selection window.
+    center : tuple
+        The axis of rotation in pixels.
+    radius : float
+        The radius of the area of interest in pixels.
+    roi : str
+        The path of a JSON sidecar file with the area of interest.
+    save_roi : str
+        The path to save the selection to when the window is used.
+    auto : bool
+        If True, the rim of the tank is detected automatically.
+    auto_threshold : float
+        The confidence the detection needs, otherwise the selection window
+        is opened instead.
+
+    Returns
+    -------
+    poly1, poly2, center, r
+        The same values returned by interaction.selection_window.
+    """
+    if center is not None and radius is not None:
+        return interact.circle_roi(center, radius, dim)
+    if roi is not None:
+        return interact.load_roi(roi, dim)
+    if auto:
+        selection, confidence = detect.detect_roi(vid, dim, start)
+        if confidence >= auto_threshold:
+            return selection
+        print('Rim detection is not confident ({:.2f}), opening the '
+              'selection window.'.format(confidence))
+
+    selection = interact.selection_window(vid, dim, start)
+    if save_roi is not None:
+        interact.save_roi(save_roi)
+    return selection
+
+def digi_rotate(t0, t1, rpm, path, crop=False, workers=1, processes=1,
+                center=None, radius=None, roi=None, save_roi=None,
+                auto=False, auto_threshold=0.5, output=None, track=None,
+                track_threshold=200, track_window=50,
+                track_background=False, codec='mp4v', crf=23,
+                preset='medium', lossless=False, index=False,
+                preview=False, preview_step=4, preview_scale=0.5,
+                proxy=False, progress=None, estimate=False, engine='affine',
+                unwrapped=False, cache=None, cache_size=20, array=False,
+                array_gray=False, array_crop=False):
     """Digitally rotates a movie.
 
     Parameters
@@ -53,11 +940,111 @@ def digi_rotate(t0, t1, rpm, path):
         The initial start time of the movie [s].
     t1 : float
         The final end time of the movie [s].
-    rpm : float
-        The rotation the film [rotations per min].
+    rpm : float or list
+        The rotation the film [rotations per min]. With a list, the film is
+        decoded and masked once and a movie is made for each rotation, with
+        the rpm added to its name.
     path : str
         The path to the movie. The full file name and extension should
         be given so the program executes correctly.
+    crop : bool
+        If True, each frame is cropped to the bounding square of the selected
+        circle before it is rotated.
+    workers : int
+        The number of threads used to rotate frames. With more than one, the
+        film is decoded, rotated and written in a pipeline. The output is the
+        same either way.
+    processes : int
+        The number of processes the film is split between. Each one rotates
+        a segment of the film, and the segments are joined with ffmpeg.
+    center : tuple
+        The axis of rotation in pixels. If given with the radius, the
+        selection window is skipped.
+    radius : float
+        The radius of the area of interest in pixels.
+    roi : str
+        A JSON sidecar file with the area of interest, used instead of the
+        selection window.
+    save_roi : str
+        A JSON file to save the selection window's points to.
+    auto : bool
+        If True, the rim of the tank is detected automatically, falling back
+        to the selection window when the detection is not confident.
+    auto_threshold : float
+        The confidence, between 0 and 1, the detection needs to be used.
+    output : str
+        The path of the rotated movie. See the notes for the default.
+    track : str
+        If given, a single particle is tracked in the rotated frames and its
+        trajectory is saved to this file (.csv or .npy). With several rpm,
+        the first one is tracked. With several processes, each segment
+        starts with a search of the whole frame.
+    track_threshold : int
+        The gray level that separates the particle from the background.
+    track_window : int
+        The half-width of the area searched around the last position [px].
+    track_background : bool
+        If True, a running background is subtracted before thresholding.
+        It needs a single process.
+    codec : str
+        The codec of the rotated movie. mp4v is written by OpenCV, anything
+        else is encoded by piping the frames to ffmpeg.
+    crf : int
+        The quality of the ffmpeg codec.
+    preset : str
+        The speed preset of the ffmpeg codec.
+    lossless : bool
+        If True, the frames are stored exactly by ffmpeg.
+    index : bool
+        If True, the frames between t0 and t1 and the angle of each frame
+        are found from the time stamp of each frame, using the index cached
+        beside the movie. Otherwise the frames are taken to be evenly spaced.
+    preview : bool
+        If True, only a quick preview is made to tune the rotation rate:
+        every preview_step frame, at preview_scale of the size and with a
+        cheaper interpolation. It is shown in a window unless proxy is set.
+        With several rpm, the first one is previewed.
+    preview_step : int
+        The preview rotates one of every this many frames.
+    preview_scale : float
+        The size of the preview relative to the movie.
+    proxy : bool
+        If True, the preview is saved as a -preview movie instead.
+    progress : bool or function
+        If True, the progress and the time taken by each stage are shown on
+        the terminal. A function is called with the metrics instead, see
+        telemetry.Telemetry. If None, nothing is measured.
+    estimate : bool
+        If True, nothing is rotated. The rotation rate is estimated from the
+        footage between t0 and t1 instead, see estimate.estimate_rpm.
+    engine : str
+        affine rotates each frame with a single warp. polar unwraps the area
+        of interest once per frame and rotates it by a shift along the
+        angle, see polar.PolarGrid.
+    unwrapped : bool
+        If True, the movie is kept in polar coordinates: each row is an angle
+        and each column a radius. This uses the polar engine.
+    cache : str
+        If given, the decoded and masked frames between t0 and t1 are kept in
+        this directory, so later runs with the same movie and area of
+        interest read them from disk instead of decoding the movie again.
+    cache_size : float
+        The largest size of the cache [GB]. The least recently used entries
+        are removed to make room.
+    array : bool
+        If True, the rotated frames are also written to a .npy file beside
+        each movie. An output ending in .npy is written as an array only.
+        Either way, the time and angle of each frame are saved beside the
+        array in a -meta.npz file.
+    array_gray : bool
+        If True, the arrays are stored in grayscale.
+    array_crop : bool
+        If True, the arrays only keep the square around the area of interest.
+
+    Returns
+    -------
+    int or float
+        The number of frames written, or the estimated rpm.
 
     Notes
     -----
@@ -65,67 +1052,259 @@ def digi_rotate(t0, t1, rpm, path):
     as the movie given. It will also be appended with a '-rot' to the file
     name to show that this is the rotated version of the movie.
     """
+    # each segment has its own tracker, which would start its own background
+    if track_background and processes > 1:
+        raise ValueError('track_background needs a single process')
+
     # film given
     vid = cv2.VideoCapture(path)
 
     # collecting frame values from film
-    fps = int(vid.get(cv2.CAP_PROP_FPS))
+    fps = vid.get(cv2.CAP_PROP_FPS)
     width = int(vid.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT))
     dim = (width, height)
 
-    # find the starting frame position
-    start = int(fps * t0)
+    if index:
+        # the frames are found from their time stamps
+        times = frameindex.load_index(path)
+        fps = frameindex.frame_rate(times, fps)
+        start, frames = frameindex.frame_range(times, t0, t1)
+    else:
+        times = None
+        # find the starting frame position
+        start = int(round(fps * t0))
+
+        # if default, variable becomes the entire length of the film
+        # else it becomes the length the user desires. The frame count can
+        # be an estimate, but reading stops at the last frame either way
+        if t1 == 0:
+            frames = int(vid.get(cv2.CAP_PROP_FRAME_COUNT)) - start
+        else:
+            frames = int(round(fps * (t1 - t0)))
 
-    # if default, variable becomes the entire length of the film
-    # else it becomes the length the user desires
-    if t1 == 0:
-        # error gets thrown if you go the complete end, so I stop 5
-        # frames before
-        frames = int(vid.get(cv2.CAP_PROP_FRAME_COUNT)) - 5
+    if output is None:
+        # remove extension of film and create new file name
+        output = path[:-4] + '-rot.mp4'
+
+    # one movie for each rotation rate
+    rpms = list(np.atleast_1d(rpm))
+    if len(rpms) == 1:
+        outputs = [output]
     else:
-        frames = int(fps * (t1 - t0))
+        root, ext = os.path.splitext(output)
+        outputs = [root + '-{:g}rpm'.format(r) + ext for r in rpms]
 
-    # remove extension of film
-    path = path[:-4]
-    # create new file name
-    output = path + '-rot.mp4'
-    # codecc and new film to be outputted
-    fourcc = cv2.VideoWriter_fourcc('m', 'p', '4', 'v')
-    video_writer = cv2.VideoWriter(output, fourcc, fps, dim)
+    # a .npy output is an array instead of a movie, and with array every
+    # movie gets an array beside it
+    movies = [None if out.endswith('.npy') else out for out in outputs]
+    arrays = [out if out.endswith('.npy') else
+              out[:-4] + '.npy' if array else None for out in outputs]
 
     # poly are used to blackout area outside of selection
     # center is used as the axis of rotation
-    poly1, poly2, center = interact.selection_window(vid, dim, start)
+    poly1, poly2, center, radius = select_roi(vid, dim, start, center,
+                                              radius, roi, save_roi, auto,
+                                              auto_threshold)
+    center = (int(center[0]), int(center[1]))
 
-    # each rotation step
-    # the negative is for the right hand rule
-    # -1 * (360 deg / 1 rot) * (1 min / 60 sec) * rpm * fps
-    dtheta = -1 * 6 * rpm / fps
+    if estimate:
+        # the selection window reads a frame, so go back to the start
+        vid.set(cv2.CAP_PROP_POS_FRAMES, start)
+        rate, error, quality = est.estimate_rpm(vid, frames, center, radius)
+        vid.release()
+
+        print('Estimated {:.3f} +/- {:.3f} rpm (match {:.2f}). Render the '
+              'full movie with --rpm {:.3f} --center {},{} --radius {:.0f}'
+              .format(rate, error, quality, rate, *center, radius))
+        return rate
+
+    # the mask is only computed once and then applied to every frame
+    mask, box = prepare_mask(poly2, dim, crop)
+
+    # the time of each frame, from its time stamp when the film is indexed
+    if times is not None:
+        stamps = times[start:start + frames]
+    else:
+        stamps = (start + np.arange(frames)) / fps
+    angles, matrices = rotation_schedule(stamps, rpms, center, dim, box)
+
+    # the selection window reads a frame, so go back to the start
+    vid.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    encoding = {'codec': codec, 'crf': crf, 'preset': preset,
+                'lossless': lossless}
+
+    if preview:
+        proxy = path[:-4] + '-preview.mp4' if proxy else None
+        count = preview_rotate(vid, frames, angles[:, 0], poly2, center, dim,
+                               fps, crop, preview_step, preview_scale,
+                               workers, proxy, encoding)
+        vid.release()
+
+        # the same area can be given straight to the full render
+        print('Previewed {} frames. Render the full movie with --rpm {:g} '
+              '--center {},{} --radius {:.0f}'.format(count, rpms[0],
+                                                      *center, radius))
+        return count
+
+    # the frames are read from the movie, or from the cache
+    source, first, masked = path, start, False
+    if cache is not None:
+        key = framecache.cache_key(path, start, frames, dim, center, box,
+                                   mask)
+        source, count = framecache.lookup(cache, key)
+        if source is None:
+            # the first run decodes and masks the frames into the cache
+            shape = (box[3] - box[1], box[2] - box[0], 3)
+            masked_frames = (crop_frame(frame, dim, mask, box)
+                             for frame in read_frames(vid, frames))
+            source, count = framecache.store(cache, key, masked_frames,
+                                             frames, shape,
+                                             cache_size * 2**30)
+        frames, first, masked = count, 0, True
+
+    # each frame is rotated by rotate(frame, plan[i])
+    if engine == 'polar' or unwrapped:
+        # the frames are cropped to the box before they are unwrapped
+        grid = polar.PolarGrid((center[0] - box[0], center[1] - box[1]),
+                               radius, dim)
+        rotate = functools.partial(polar_fan_out, dim=dim, grid=grid,
+                                   mask=mask, box=box, unwrapped=unwrapped,
+                                   masked=masked)
+        plan = angles
+    else:
+        grid = None
+        rotate = functools.partial(fan_out, center=center, dim=dim,
+                                   mask=mask, box=box, masked=masked)
+        plan = matrices
+    out_dim = grid.shape if unwrapped else dim
+
+    # the arrays can be cropped to the area of interest, which is centered
+    # once rotated
+    box_out = None
+    if array_crop and not unwrapped:
+        x0 = max(int(out_dim[0] / 2 - radius), 0)
+        y0 = max(int(out_dim[1] / 2 - radius), 0)
+        box_out = (x0, y0, min(int(np.ceil(out_dim[0] / 2 + radius)),
+                               out_dim[0]),
+                   min(int(np.ceil(out_dim[1] / 2 + radius)), out_dim[1]))
+    layout = dict(encoding, count=frames, gray=array_gray, box=box_out)
+
+    tracker = None
+    if track is not None:
+        tracker = tracking.Tracker(track_threshold, track_window,
+                                   track_background)
+
+    timer = None
+    if progress is not None and progress is not False:
+        callback = telemetry.show_progress if progress is True else progress
+        timer = telemetry.Telemetry(frames, callback)
 
     # performing rotation
-    for i in range(frames):
-        # collect current frame and resize
-        ret, frame = vid.read()
-        frame = cv2.resize(frame, dim, interpolation=cv2.INTER_CUBIC)
+    if processes > 1:
+        vid.release()
+        # split the frames into segments, each rotated in its own process
+        bounds = np.linspace(0, frames, processes + 1).astype(int)
+        outdir = os.path.dirname(os.path.abspath(output))
+        # the segments write straight into their part of each array
+        shape = encoder.array_shape(frames, out_dim, array_gray, box_out)
+        for path_array in arrays:
+            if path_array is not None:
+                encoder.allocate_array(path_array, shape)
 
-        # blackout region outside
-        cv2.fillPoly(frame, np.array([poly1, poly2]), 0)
-        cv2.circle(frame, center, 4, (255,0,0), -1)
+        with tempfile.TemporaryDirectory(dir=outdir) as tmp:
+            with ProcessPoolExecutor(max_workers=processes) as pool:
+                ranges = [(lo, hi) for lo, hi in zip(bounds, bounds[1:])
+                          if hi > lo]
+                segments = [[os.path.join(tmp, '{}-{}.mp4'.format(n, k))
+                             if movie is not None else None
+                             for k, movie in enumerate(movies)]
+                            for n in range(len(ranges))]
+                jobs = [pool.submit(rotate_segment, source, parts, first + lo,
+                                    plan[lo:hi], rotate, out_dim, fps,
+                                    workers, tracker, layout,
+                                    timer is not None, arrays, lo)
+                        for parts, (lo, hi) in zip(segments, ranges)]
 
-        # rotate frame
-        M = cv2.getRotationMatrix2D(center, i*dtheta, 1.0)
-        frame = cv2.warpAffine(frame, M, dim)
+                if timer is not None:
+                    # the progress moves as each segment finishes
+                    for job in as_completed(jobs):
+                        count, _, stages = job.result()
+                        timer.merge(stages)
+                        timer.tick(count)
+                results = [job.result() for job in jobs]
 
-        # re-center and re-size frame
-        frame = interact.center_frame(frame, center[0], center[1], dim)
-        centered = cv2.resize(frame, dim, interpolation=cv2.INTER_CUBIC)
-        # write new frame to output
-        video_writer.write(centered)
+            # a frame count that is too high can leave segments empty
+            for k, movie in enumerate(movies):
+                if movie is not None:
+                    concat_segments([parts[k] for parts, (count, _, _) in
+                                     zip(segments, results) if count > 0],
+                                    movie)
 
-    # save output
-    video_writer.release()
+        written = sum(count for count, _, _ in results)
+        for path_array in arrays:
+            if path_array is not None:
+                encoder.shrink_array(path_array, written)
+        positions = [p for _, part, _ in results for p in part or []]
+    else:
+        writers = [open_writer(movie, fps, out_dim, array=path_array,
+                               **layout)
+                   for movie, path_array in zip(movies, arrays)]
+
+        def transform(i, frame):
+            return rotate(frame, plan[i], telemetry=timer)
+
+        if masked:
+            decoded = framecache.read_entry(source, 0, frames)
+        else:
+            decoded = read_frames(vid, frames)
+        written = write_frames(decoded, transform,
+                               [writer.write for writer in writers], workers,
+                               tracker, timer)
+        positions = tracker and tracker.positions
+
+        # save output
+        if timer is not None:
+            with timer.stage('write'):
+                for writer in writers:
+                    writer.release()
+        else:
+            for writer in writers:
+                writer.release()
+        vid.release()
+
+    if timer is not None:
+        timer.finish()
+
+    if tracker is not None:
+        # the particle was tracked in the rotated frames
+        rotated = np.array(positions, dtype=float).reshape(-1, 2)
+        if unwrapped:
+            # the positions are saved in the frame the movie would have
+            rotated = grid.to_frame(rotated)
+        n = len(rotated)
+        lab = tracking.to_lab(rotated, angles[:n, 0], center, dim)
+        tracking.save_track(track, stamps[:n], lab, rotated)
+
+    # the arrays are described beside them, for analysis
+    for k, path_array in enumerate(arrays):
+        if path_array is not None:
+            np.savez(path_array[:-4] + '-meta.npz', times=stamps[:written],
+                     angles=angles[:written, k], rpm=rpms[k], fps=fps,
+                     center=center, radius=radius, unwrapped=unwrapped,
+                     box=box_out if box_out is not None else
+                     (0, 0) + tuple(out_dim))
+
+    return written
 
 # module runs on cLI if run on its own
 if __name__ == "__main__":
-    digi_rotate(t0, t1, rpm, path)
+    # collecting user input
+    args = parser.parse_args()
+    if args.track_background and args.processes > 1:
+        parser.error('--track-background cannot be used with --processes')
+
+    # the arguments are passed by name, every flag is named after the
+    # parameter of digi_rotate it sets
+    digi_rotate(**vars(args))
@@ -0,0 +1,205 @@
+import subprocess
+
+import cv2
+import numpy as np
+
+
+class FFmpegWriter:
+    """Writes frames by piping raw BGR data into an ffmpeg process. It has the
+    same write and release methods as cv2.VideoWriter, but any codec ffmpeg
+    knows can be used along with its speed and quality settings.
+
+    Parameters
+    ----------
+    output : str
+        The path of the film to be written.
+    fps : float
+        The frame rate of the film.
+    dim : tuple
+        The (width, height) of the frames.
+    codec : str
+        The ffmpeg video encoder, for example libx264 or libx265.
+    crf : int
+        The constant rate factor; lower values give better quality and
+        larger files.
+    preset : str
+        The encoder preset, from ultrafast for previews to veryslow for
+        archives.
+    lossless : bool
+        If True, the frames are stored exactly with libx264rgb, for
+        intermediate films that are processed further. The codec and crf
+        are ignored.
+    """
+
+    def __init__(self, output, fps, dim, codec='libx264', crf=23,
+                 preset='medium', lossless=False):
+        self.dim = dim
+        command = ['ffmpeg', '-y', '-loglevel', 'error',
+                   '-f', 'rawvideo', '-pix_fmt', 'bgr24',
+                   '-s', '{}x{}'.format(*dim), '-r', str(fps), '-i', '-']
+
+        if lossless:
+            # the rgb flavour of x264 keeps the BGR values bit for bit
+            command += ['-c:v', 'libx264rgb', '-qp', '0', '-preset', preset]
+        else:
+            # most players need yuv420p, which needs even dimensions
+            command += ['-c:v', codec, '-crf', str(crf), '-preset', preset,
+                        '-vf', 'pad=ceil(iw/2)*2:ceil(ih/2)*2',
+                        '-pix_fmt', 'yuv420p']
+
+        self.process = subprocess.Popen(command + [output],
+                                        stdin=subprocess.PIPE)
+
+    def write(self, frame):
+        """Writes a single BGR frame."""
+        if frame.shape[1::-1] != tuple(self.dim):
+            raise ValueError('frame is {}x{}, the film is {}x{}'.format(
+                frame.shape[1], frame.shape[0], *self.dim))
+        # the frame is handed over without a copy when it is contiguous
+        self.process.stdin.write(memoryview(np.ascontiguousarray(frame)))
+
+    def release(self):
+        """Finishes the film and waits for ffmpeg to exit."""
+        self.process.stdin.close()
+        if self.process.wait() != 0:
+            raise RuntimeError('ffmpeg exited with code {}'.format(
+                self.process.returncode))
+
+def array_shape(count, dim, gray=False, box=None):
+    """Finds the shape of the array a film is written to.
+
+    Parameters
+    ----------
+    count : int
+        The number of frames.
+    dim : tuple
+        The (width, height) of the frames.
+    gray : bool
+        If True, the frames are stored in grayscale.
+    box : tuple
+        If given, the (x0, y0, x1, y1) part of each frame that is stored.
+
+    Returns
+    -------
+    tuple
+        The shape of the array.
+    """
+    if box is not None:
+        dim = (box[2] - box[0], box[3] - box[1])
+    shape = (count, dim[1], dim[0])
+    return shape if gray else shape + (3,)
+
+def allocate_array(output, shape):
+    """Creates a .npy file of the given shape without writing its frames,
+    which only take space on disk once they are written."""
+    array = np.lib.format.open_memmap(output, mode='w+', dtype=np.uint8,
+                                      shape=shape)
+    del array
+
+def shrink_array(output, count):
+    """Cuts a .npy file down to its first frames, for a film that turned out
+    shorter than its frame count. Only the header is rewritten.
+
+    Parameters
+    ----------
+    output : str
+        The path of the .npy file.
+    count : int
+        The number of frames to keep.
+    """
+    array = np.load(output, mmap_mode='r')
+    shape = (count,) + array.shape[1:]
+    offset = array.offset
+    frame = int(np.prod(array.shape[1:]))
+    del array
+
+    with open(output, 'r+b') as f:
+        version = np.lib.format.read_magic(f)
+        # the length of the header is kept, so it only needs padding
+        start = 10 if version == (1, 0) else 12
+        header = repr({'descr': '|u1', 'fortran_order': False,
+                       'shape': shape})
+        f.seek(start)
+        f.write(header.ljust(offset - start - 1).encode('latin1') + b'\n')
+        f.truncate(offset + count * frame)
+
+class ArrayWriter:
+    """Writes frames into a memory-mapped .npy file, which analysis code can
+    slice without a video decoder and without loading the whole film. It has
+    the same write and release methods as cv2.VideoWriter.
+
+    Parameters
+    ----------
+    output : str
+        The path of the .npy file.
+    dim : tuple
+        The (width, height) of the frames.
+    count : int
+        The largest number of frames. The file is cut down to the frames
+        written when it is released.
+    gray : bool
+        If True, the frames are stored in grayscale.
+    box : tuple
+        If given, only the (x0, y0, x1, y1) part of each frame is stored.
+    offset : int
+        If given, the file was already made by allocate_array and the frames
+        are written from this frame on, so several processes can fill one
+        file. It is then left as it is when released.
+    """
+
+    def __init__(self, output, dim, count, gray=False, box=None,
+                 offset=None):
+        self.output = output
+        self.dim = dim
+        self.gray = gray
+        self.box = box
+        if offset is None:
+            allocate_array(output, array_shape(count, dim, gray, box))
+        self.array = np.load(output, mmap_mode='r+')
+        self.owner = offset is None
+        self.start = offset or 0
+        self.written = 0
+
+    def write(self, frame):
+        """Writes a single BGR frame."""
+        if frame.shape[1::-1] != tuple(self.dim):
+            raise ValueError('frame is {}x{}, the film is {}x{}'.format(
+                frame.shape[1], frame.shape[0], *self.dim))
+        if self.box is not None:
+            x0, y0, x1, y1 = self.box
+            frame = frame[y0:y1, x0:x1]
+        if self.gray:
+            frame = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        self.array[self.start + self.written] = frame
+        self.written += 1
+
+    def release(self):
+        """Finishes the file, cutting off the frames that were not
+        written."""
+        self.array.flush()
+        del self.array
+        if self.owner:
+            shrink_array(self.output, self.written)
+
+class TeeWriter:
+    """Writes the same frames to several writers, such as a movie and an
+    array.
+
+    Parameters
+    ----------
+    writers : list
+        The writers, each with write and release methods.
+    """
+
+    def __init__(self, writers):
+        self.writers = writers
+
+    def write(self, frame):
+        """Writes a single frame to every writer."""
+        for writer in self.writers:
+            writer.write(frame)
+
+    def release(self):
+        """Releases every writer."""
+        for writer in self.writers:
+            writer.release()
@@ -0,0 +1,169 @@
+import cv2
+import numpy as np
+
+
+def sample_polar(video, frames, center, radius, samples=60, stride=2,
+                 size=256, bins=360):
+    """Reads a few frames of the film and unwraps the disk of each into polar
+    coordinates, so a rotation of the disk becomes a shift along the angle.
+    The frames in between are grabbed without being converted, and the disk
+    is downscaled before it is unwrapped, which keeps this fast for large
+    films.
+
+    Parameters
+    ----------
+    video : Object
+        The opened film, at the first frame to be sampled.
+    frames : int
+        The number of frames of the film that can be sampled from.
+    center : tuple
+        The axis of rotation in pixels.
+    radius : float
+        The radius of the area of interest in pixels.
+    samples : int
+        The largest number of frames to unwrap.
+    stride : int
+        The number of frames between each sample.
+    size : int
+        The diameter the disk is downscaled to [px].
+    bins : int
+        The number of angles the disk is unwrapped into.
+
+    Returns
+    -------
+    times : array_like
+        The time of each sample [s].
+    polar : array_like
+        The unwrapped disks, shape (samples, bins, size // 2). Each row is an
+        angle and each column a distance from the center.
+    """
+    # only the square around the disk is downscaled
+    x0 = max(int(center[0] - radius), 0)
+    y0 = max(int(center[1] - radius), 0)
+    x1 = int(center[0] + radius) + 1
+    y1 = int(center[1] + radius) + 1
+    scale = size / (2 * radius)
+    pcenter = ((center[0] - x0) * scale, (center[1] - y0) * scale)
+
+    times, polar = [], []
+    for i in range(min(samples * stride, frames)):
+        if i % stride:
+            if not video.grab():
+                break
+            continue
+        ret, frame = video.read()
+        if not ret:
+            break
+        times.append(video.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+
+        gray = cv2.cvtColor(frame[y0:y1, x0:x1], cv2.COLOR_BGR2GRAY)
+        small = cv2.resize(gray, None, fx=scale, fy=scale,
+                           interpolation=cv2.INTER_AREA)
+        # the polar image only reaches the radius, so nothing outside of the
+        # area of interest is used
+        polar.append(cv2.warpPolar(small, (size // 2, bins), pcenter,
+                                   radius * scale,
+                                   cv2.WARP_POLAR_LINEAR + cv2.INTER_LINEAR))
+    return np.array(times), np.array(polar, dtype=np.float32)
+
+def angular_shift(a, b, upsample=16):
+    """Finds the rotation between two unwrapped disks by phase correlation
+    along the angle. The angle wraps around, so no window is needed.
+
+    Parameters
+    ----------
+    a, b : array_like
+        The unwrapped disks made by sample_polar, shape (bins, radii).
+    upsample : int
+        The number of steps each bin is split into when looking for the
+        peak.
+
+    Returns
+    -------
+    shift : float
+        The counter-clockwise rotation on screen from a to b [deg].
+    peak : float
+        The height of the correlation peak, between 0 and 1. It is low when
+        the disks do not match.
+    """
+    bins = a.shape[0]
+    # the mean of each radius says nothing about the rotation
+    fa = np.fft.fft(a - a.mean(axis=0), axis=0)
+    fb = np.fft.fft(b - b.mean(axis=0), axis=0)
+
+    # the cross-power spectrum of every radius is summed before normalising,
+    # so the radii with more texture count for more
+    cross = (fa * np.conj(fb)).sum(axis=1)
+    cross /= np.abs(cross) + 1e-12
+
+    # zero padding the spectrum samples the correlation at a fraction of a
+    # bin, since a parabola through whole bins is biased towards them
+    half = bins // 2
+    padded = np.zeros(bins * upsample, complex)
+    padded[:half] = cross[:half]
+    padded[-half:] = cross[-half:]
+    corr = np.fft.ifft(padded).real * upsample
+
+    # what is left of a bin is found with a parabola
+    n = len(corr)
+    k = int(np.argmax(corr))
+    left, mid, right = corr[k - 1], corr[k], corr[(k + 1) % n]
+    curve = left - 2 * mid + right
+    delta = 0.5 * (left - right) / curve if curve < 0 else 0.0
+
+    shift = ((k + delta) / upsample + bins / 2) % bins - bins / 2
+    return shift * 360 / bins, mid
+
+def estimate_rpm(video, frames, center, radius, samples=60, stride=2,
+                 size=256, inner=0.1):
+    """Estimates the rotation rate of the film from its footage. The angle of
+    each sample from the first is found by phase correlation, and a line is
+    fitted to the angles against time.
+
+    Parameters
+    ----------
+    video : Object
+        The opened film, at the first frame to be sampled.
+    frames : int
+        The number of frames of the film that can be sampled from.
+    center : tuple
+        The axis of rotation in pixels.
+    radius : float
+        The radius of the area of interest in pixels.
+    samples : int
+        The largest number of frames to unwrap.
+    stride : int
+        The number of frames between each sample. The disk must turn less
+        than half a rotation between samples.
+    size : int
+        The diameter the disk is downscaled to [px].
+    inner : float
+        The part of the radius around the center that is left out, since it
+        is only a few pixels wide once unwrapped.
+
+    Returns
+    -------
+    rpm : float
+        The rotation to give digi_rotate so the disk stands still
+        [rotations per min].
+    error : float
+        The standard error of the fit [rotations per min].
+    quality : float
+        The mean height of the correlation peaks, between 0 and 1.
+    """
+    times, polar = sample_polar(video, frames, center, radius, samples,
+                                stride, size)
+    if len(times) < 4:
+        raise ValueError('{} frames were sampled, at least 4 are needed to '
+                         'estimate the rotation'.format(len(times)))
+    polar = polar[:, :, int(inner * polar.shape[2]):]
+
+    # every sample is compared with the first, as small errors would add up
+    # over a chain of pairs. The disk turns less than half a rotation between
+    # samples, so the angles can be unwrapped
+    shifts, peaks = zip(*(angular_shift(polar[0], b) for b in polar))
+    angles = np.unwrap(shifts, period=360)
+
+    # digi_rotate turns the film clockwise by 6 deg/s for each rpm
+    fit, cov = np.polyfit(times, angles, 1, cov=True)
+    return fit[0] / 6, np.sqrt(cov[0, 0]) / 6, float(np.mean(peaks))
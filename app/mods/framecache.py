@@ -0,0 +1,192 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+
+def file_hash(path, chunk=1 << 20):
+    """Finds a fingerprint of a movie. Only the size and a chunk from the
+    start, middle and end are hashed, which is quick for large movies and
+    still changes when the movie is replaced or edited.
+
+    Parameters
+    ----------
+    path : str
+        The path to the movie.
+    chunk : int
+        The number of bytes hashed at each place [B].
+
+    Returns
+    -------
+    str
+        The fingerprint of the movie.
+    """
+    size = os.path.getsize(path)
+    digest = hashlib.sha1(str(size).encode())
+    with open(path, 'rb') as f:
+        for place in (0, max(size // 2 - chunk // 2, 0), max(size - chunk, 0)):
+            f.seek(place)
+            digest.update(f.read(chunk))
+    return digest.hexdigest()
+
+def cache_key(path, start, frames, dim, center, box, mask):
+    """Finds the name of the cache entry for the frames of a movie, masked in
+    one way. Anything that changes the masked frames changes the key.
+
+    Parameters
+    ----------
+    path : str
+        The path to the movie.
+    start : int
+        The first frame.
+    frames : int
+        The number of frames.
+    dim, center, box, mask
+        See digipyro.crop_frame.
+
+    Returns
+    -------
+    str
+        The key of the entry.
+    """
+    digest = hashlib.sha1(file_hash(path).encode())
+    # the layout of the entries comes first, so entries made before the axis
+    # of rotation was left off the frames are not used
+    digest.update(json.dumps([2, int(start), int(frames), list(dim),
+                              [int(c) for c in center],
+                              [int(b) for b in box]]).encode())
+    if mask is not None:
+        digest.update(np.ascontiguousarray(mask).tobytes())
+    return digest.hexdigest()
+
+def entry_path(directory, key):
+    """Finds the path of the frames of a cache entry."""
+    return os.path.join(directory, key + '.npy')
+
+def disk_size(path):
+    """Finds the space a file takes on disk, which is less than its size for
+    the unwritten end of an entry [B]."""
+    return os.stat(path).st_blocks * 512
+
+def lookup(directory, key):
+    """Finds a cache entry and marks it as the most recently used.
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the cache.
+    key : str
+        The key made by cache_key.
+
+    Returns
+    -------
+    path : str
+        The path of the frames, a .npy file that can be memory-mapped, or
+        None if there is no entry.
+    count : int
+        The number of frames in the entry.
+    """
+    path = entry_path(directory, key)
+    meta = path[:-4] + '.json'
+    if not (os.path.exists(path) and os.path.exists(meta)):
+        return None, 0
+
+    with open(meta) as f:
+        count = json.load(f)['count']
+    # the modification time orders the entries for eviction
+    os.utime(path)
+    return path, count
+
+def evict(directory, limit, needed=0):
+    """Removes the least recently used entries until the cache and a new
+    entry fit within the limit.
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the cache.
+    limit : float
+        The largest size of the cache [B].
+    needed : int
+        The size of the entry about to be added [B].
+    """
+    entries = [os.path.join(directory, name)
+               for name in os.listdir(directory) if name.endswith('.npy')]
+    entries.sort(key=os.path.getmtime)
+    total = sum(disk_size(entry) for entry in entries)
+
+    for entry in entries:
+        if total + needed <= limit:
+            break
+        total -= disk_size(entry)
+        os.remove(entry)
+        if os.path.exists(entry[:-4] + '.json'):
+            os.remove(entry[:-4] + '.json')
+
+def store(directory, key, frames, count, shape, limit):
+    """Saves frames as a new cache entry. The frames are written straight
+    into a memory-mapped .npy file, so they are never all held in memory.
+
+    Parameters
+    ----------
+    directory : str
+        The directory of the cache.
+    key : str
+        The key made by cache_key.
+    frames : iterable
+        The frames to save.
+    count : int
+        The largest number of frames.
+    shape : tuple
+        The (height, width, channels) of each frame.
+    limit : float
+        The largest size of the cache [B]. Older entries are evicted to make
+        room.
+
+    Returns
+    -------
+    path : str
+        The path of the frames.
+    count : int
+        The number of frames saved.
+    """
+    os.makedirs(directory, exist_ok=True)
+    evict(directory, limit, count * int(np.prod(shape)))
+
+    path = entry_path(directory, key)
+    partial = path[:-4] + '.part.npy'
+    array = np.lib.format.open_memmap(partial, mode='w+', dtype=np.uint8,
+                                      shape=(count,) + tuple(shape))
+    written = 0
+    for frame in frames:
+        array[written] = frame
+        written += 1
+    array.flush()
+    del array
+
+    # the entry only appears once it is complete
+    with open(path[:-4] + '.json', 'w') as f:
+        json.dump({'count': written}, f)
+    os.replace(partial, path)
+    return path, written
+
+def read_entry(path, first, count):
+    """Reads frames from a cache entry without copying them.
+
+    Parameters
+    ----------
+    path : str
+        The path of the frames.
+    first : int
+        The first frame to read.
+    count : int
+        The number of frames to read.
+
+    Yields
+    ------
+    array_like
+        Each frame, a read-only view of the memory-mapped file.
+    """
+    array = np.load(path, mmap_mode='r')
+    yield from array[first:first + count]
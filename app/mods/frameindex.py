@@ -0,0 +1,124 @@
+import os
+
+import cv2
+import numpy as np
+
+
+def index_path(path):
+    """Finds the path of the index cached beside a movie."""
+    return path + '.index.npz'
+
+def stamp(movie):
+    """Records the size and modification time of a movie, which change when
+    the movie is replaced."""
+    info = os.stat(movie)
+    return {'size': info.st_size, 'mtime': info.st_mtime}
+
+def build_index(path):
+    """Finds the presentation time of every frame of a movie. The frames are
+    only grabbed, not converted, so this is quicker than reading the movie.
+
+    Parameters
+    ----------
+    path : str
+        The path to the movie.
+
+    Returns
+    -------
+    array_like
+        The time of each frame [s].
+    """
+    vid = cv2.VideoCapture(path)
+    times = []
+    while vid.grab():
+        times.append(vid.get(cv2.CAP_PROP_POS_MSEC) / 1000)
+    vid.release()
+    return np.array(times)
+
+def load_index(path, cache=True):
+    """Loads the frame times of a movie, building them the first time. The
+    index is cached beside the movie and rebuilt when the movie changes.
+
+    Parameters
+    ----------
+    path : str
+        The path to the movie.
+    cache : bool
+        If True, the index is read from and saved to the cache.
+
+    Returns
+    -------
+    array_like
+        The time of each frame [s].
+    """
+    cached = index_path(path)
+    current = stamp(path)
+    current = np.array([current['size'], current['mtime']])
+    if cache and os.path.exists(cached):
+        with np.load(cached) as index:
+            if np.array_equal(index['stamp'], current):
+                return index['times']
+
+    times = build_index(path)
+    if cache:
+        try:
+            np.savez(cached, times=times, stamp=current)
+        except OSError:
+            # a read-only directory only loses the cache
+            pass
+    return times
+
+def frame_range(times, t0, t1):
+    """Finds the frames shown between two times.
+
+    Parameters
+    ----------
+    times : array_like
+        The time of each frame [s].
+    t0 : float
+        The start time [s].
+    t1 : float
+        The end time [s]. If 0, the range goes to the end of the movie.
+
+    Returns
+    -------
+    start : int
+        The first frame shown at or after t0.
+    frames : int
+        The number of frames from the start that are shown before t1.
+    """
+    # half a millisecond absorbs the rounding of the stored times
+    start = int(np.searchsorted(times, t0 - 5e-4))
+    if t1 == 0:
+        stop = len(times)
+    else:
+        stop = int(np.searchsorted(times, t1 - 5e-4))
+    return start, max(stop - start, 0)
+
+def frame_rate(times, default):
+    """Finds the frame rate of a movie from its frame times.
+
+    Parameters
+    ----------
+    times : array_like
+        The time of each frame [s].
+    default : float
+        The frame rate the movie gives, used when it agrees with the frame
+        times or when there are too few frames.
+
+    Returns
+    -------
+    float
+        The frame rate.
+    """
+    if len(times) < 2 or times[-1] <= times[0]:
+        return default
+
+    # some containers store the times in whole milliseconds, so the steps of
+    # a 29.97 fps movie alternate between 33 and 34 ms. The rate given by
+    # the movie is kept when it is within that rounding, otherwise the
+    # mean step is used, which the rounding does not bias
+    step = np.median(np.diff(times))
+    if default > 0 and abs(step - 1 / default) <= 1e-3:
+        return default
+    return (len(times) - 1) / (times[-1] - times[0])
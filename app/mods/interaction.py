@@ -1,3 +1,5 @@
+import json
+
 import cv2
 import numpy as np
 
@@ -21,6 +23,8 @@ def selection_window(video, dim, start):
         The areas that will be blacked out from the film.
     center : tuple
         The axis of rotation.
+    r : float
+        The radius of the fitted circle.
     """
     global npts, center, frame, xpoints, ypoints, r, poly1, poly2
 
@@ -44,7 +48,7 @@ def selection_window(video, dim, start):
             remove_point(orig)
 
     cv2.destroyWindow('Select Circle')
-    return poly1, poly2, center
+    return poly1, poly2, center, r
 
 def select_circle(event, x, y, flags, param):
     """The user clicks points along the circumference of a circular region of
@@ -83,22 +87,8 @@ def select_circle(event, x, y, flags, param):
             center = (bestfit[0], bestfit[1])
             r = bestfit[2]
 
-            poly1 = np.array([[0,0],
-                              [frame.shape[1],0],
-                              [frame.shape[1],frame.shape[0]],
-                              [0,frame.shape[0]]])
-
-            poly2 = np.array([[bestfit[0]+r,
-                               bestfit[1]]])
-            circpts = 100
-            # approximate the circle as a 100-gon
-            # which makes it easier to draw the mask,
-            # as we define the mask region as the area between two polygons
-            for i in range(1,circpts):
-                theta =  2 * np.pi * (i / circpts)
-                nextpt = np.array([[int(bestfit[0] + (r * np.cos(theta))),
-                                    int(bestfit[1] + (r * np.sin(theta)))]])
-                poly2 = np.append(poly2, nextpt, axis=0)
+            poly1, poly2 = circle_polygons(bestfit[0], bestfit[1], r,
+                                           frame.shape[1::-1])
 
             cv2.circle(frame, center, 4, (255,0,0), -1)
             cv2.circle(frame, center, r, (0,255,0), 1)
@@ -106,6 +96,101 @@ def select_circle(event, x, y, flags, param):
         cv2.imshow('Select Circle', frame)
         frame = clone.copy()
 
+def circle_polygons(xc, yc, r, dim):
+    """Creates the polygons that black out the area outside of a circle.
+
+    Parameters
+    ----------
+    xc, yc : int
+        The center of the circle.
+    r : int
+        The radius of the circle.
+    dim : tuple
+        The (width, height) of the frame.
+
+    Returns
+    -------
+    poly1, poly2 : array_like
+        The border of the frame and the circle.
+    """
+    width = dim[0]
+    height = dim[1]
+    poly1 = np.array([[0,0], [width,0], [width,height], [0,height]])
+
+    # approximate the circle as a 100-gon
+    # which makes it easier to draw the mask,
+    # as we define the mask region as the area between two polygons
+    circpts = 100
+    theta = 2 * np.pi * np.arange(circpts) / circpts
+    poly2 = np.stack([xc + r * np.cos(theta),
+                      yc + r * np.sin(theta)], axis=1).astype(int)
+    return poly1, poly2
+
+def circle_roi(center, r, dim):
+    """Creates the area of interest from a known center and radius, without
+    opening the selection window.
+
+    Parameters
+    ----------
+    center : tuple
+        The axis of rotation.
+    r : float
+        The radius of the circle of interest.
+    dim : tuple
+        The (width, height) of the frame.
+
+    Returns
+    -------
+    poly1, poly2, center, r
+        The same values returned by selection_window. The radius is the one
+        given, not the one of the polygon, whose corners are rounded to the
+        pixel.
+    """
+    center = (int(center[0]), int(center[1]))
+    poly1, poly2 = circle_polygons(center[0], center[1], int(r), dim)
+    return poly1, poly2, center, r
+
+def load_roi(path, dim):
+    """Reads the area of interest from a JSON sidecar file. The file either
+    holds the clicked "points", which are fitted with calc_center, or the
+    "center" and "radius" of the circle.
+
+    Parameters
+    ----------
+    path : str
+        The path of the sidecar file.
+    dim : tuple
+        The (width, height) of the frame.
+
+    Returns
+    -------
+    poly1, poly2, center, r
+        The same values returned by selection_window.
+    """
+    with open(path) as f:
+        roi = json.load(f)
+
+    if 'points' in roi:
+        points = np.array(roi['points'])
+        bestfit = calc_center(points[:, 0], points[:, 1])
+        return circle_roi(bestfit[:2], bestfit[2], dim)
+    return circle_roi(roi['center'], roi['radius'], dim)
+
+def save_roi(path):
+    """Writes the points clicked in the last selection window to a JSON sidecar
+    file, along with the fitted center and radius.
+
+    Parameters
+    ----------
+    path : str
+        The path of the sidecar file.
+    """
+    roi = {'points': np.stack([xpoints, ypoints], axis=1).tolist(),
+           'center': [int(center[0]), int(center[1])],
+           'radius': int(r)}
+    with open(path, 'w') as f:
+        json.dump(roi, f, indent=2)
+
 def calc_center(xp, yp):
     """This calculates the center and radius of the best-fit circle through
     an array of points by the least-squares method.
@@ -118,8 +203,28 @@ def calc_center(xp, yp):
     Returns
     -------
     array_like
-        The best-fit circle through the array of points.
+        The best-fit circle through the array of points, truncated to the
+        pixel.
     """
+    xc, yc, r = fit_circle(xp, yp)
+    return np.array([int(xc), int(yc), int(r)])
+
+def fit_circle(xp, yp):
+    """Finds the best-fit circle through an array of points by the
+    least-squares method, without rounding it.
+
+    Parameters
+    ----------
+    xp, yp : array_like
+        The x and y points.
+
+    Returns
+    -------
+    xc, yc, r : float
+        The center and radius of the circle.
+    """
+    xp = np.asarray(xp, dtype=np.float64)
+    yp = np.asarray(yp, dtype=np.float64)
     # arguments used in computations
     xp2 = xp**2
     yp2 = yp**2
@@ -142,7 +247,7 @@ def calc_center(xp, yp):
     yc = M[1] / 2
     d = M[0]**2 + M[1]**2 + M[2] * 4
     diam = np.sqrt(d)
-    return np.array([int(xc), int(yc), int(diam / 2)])
+    return xc, yc, diam / 2
 
 def instructions_circle(img):
     """Displays instructions on the screen for identifyin the circle of
@@ -204,19 +309,8 @@ def remove_point(orig):
         bestfit = calc_center(xpoints, ypoints)
         center = (bestfit[0], bestfit[1])
         r = bestfit[2]
-        poly1 = np.array([[0,0], [frame.shape[1],0],
-                         [frame.shape[1],frame.shape[0]],
-                         [0,frame.shape[0]]])
-
-        poly2 = np.array([[bestfit[0]+r, bestfit[1]]])
-        circpts = 100
-        for i in range(1,circpts):
-            theta =  2 * np.pi * (float(i) / circpts)
-
-            nextpt = np.array([[int(bestfit[0] + (r * np.cos(theta))),
-                                int(bestfit[1] + (r * np.sin(theta)))]])
-
-            poly2 = np.append(poly2,nextpt,axis=0)
+        poly1, poly2 = circle_polygons(bestfit[0], bestfit[1], r,
+                                       frame.shape[1::-1])
 
         cv2.circle(frame, center, 4, (255,0,0), -1)
         cv2.circle(frame, center, r, (0,255,0), 1)
@@ -239,10 +333,134 @@ def center_frame(img, x_c, y_c, dim):
     Object
         A transformed centered frame to match with the rotation transform.
     """
+    shiftMatrix = center_matrix(x_c, y_c, dim)
+    return cv2.warpAffine(img, shiftMatrix, dim)
+
+def center_matrix(x_c, y_c, dim):
+    """Creates the affine matrix that shifts a frame so it is centered at
+    (x_c, y_c).
+
+    Parameters
+    ----------
+    x_c, y_c : floats
+        The point to center the frame at.
+    dim : tuple
+        The (width, height) of the frame.
+
+    Returns
+    -------
+    array_like
+        The 2x3 shift matrix used by cv2.warpAffine.
+    """
     width = dim[0]
     height = dim[1]
 
     dx = (width / 2) - x_c
     dy = (height / 2) - y_c
-    shiftMatrix = np.float32([[1, 0, dx], [0, 1, dy]])
-    return cv2.warpAffine(img, shiftMatrix, (width, height))
+    return np.float32([[1, 0, dx], [0, 1, dy]])
+
+def rotation_matrix(center, angle, dim, offset=(0, 0)):
+    """Creates a single affine matrix that rotates a frame about the center and
+    then re-centers it, so the frame only needs to be resampled once.
+
+    Parameters
+    ----------
+    center : tuple
+        The axis of rotation.
+    angle : float
+        The rotation angle [deg].
+    dim : tuple
+        The (width, height) of the frame.
+    offset : tuple
+        The (x, y) position of the top-left corner of the input in the full
+        frame. This is used when the input has been cropped.
+
+    Returns
+    -------
+    array_like
+        The 2x3 matrix used by cv2.warpAffine.
+    """
+    return rotation_matrices(center, angle, dim, offset)
+
+def rotation_matrices(center, angles, dim, offset=(0, 0)):
+    """Creates the matrices of rotation_matrix for many angles at once, so a
+    whole film can be planned before any frame is read.
+
+    Parameters
+    ----------
+    center : tuple
+        The axis of rotation.
+    angles : array_like
+        The rotation angles [deg], of any shape.
+    dim : tuple
+        The (width, height) of the frame.
+    offset : tuple
+        The (x, y) position of the top-left corner of the input in the full
+        frame. This is used when the input has been cropped.
+
+    Returns
+    -------
+    array_like
+        The 2x3 matrices used by cv2.warpAffine, shape angles.shape + (2, 3).
+    """
+    angles = np.asarray(angles, dtype=np.float64)
+    theta = np.deg2rad(angles)
+    a, b = np.cos(theta), np.sin(theta)
+    cx, cy = center
+
+    # same layout as cv2.getRotationMatrix2D
+    M = np.empty(angles.shape + (2, 3))
+    M[..., 0, 0], M[..., 0, 1] = a, b
+    M[..., 1, 0], M[..., 1, 1] = -b, a
+    M[..., 0, 2] = (1 - a)*cx - b*cy
+    M[..., 1, 2] = b*cx + (1 - a)*cy
+
+    # a cropped input is moved back to its place in the full frame first
+    M[..., 2] += M[..., :2] @ np.float64(offset)
+    # the shift is a pure translation, so composing it with the rotation
+    # only changes the last column
+    M[..., 2] += center_matrix(cx, cy, dim)[:, 2]
+    return M
+
+def circle_mask(poly, dim):
+    """Creates the mask of the circular area of interest. This is computed once
+    so the frames only need a cheap bitwise operation to black out the area
+    outside of the selection.
+
+    Parameters
+    ----------
+    poly : array_like
+        The polygon that approximates the circle of interest.
+    dim : tuple
+        The (width, height) of the frame.
+
+    Returns
+    -------
+    array_like
+        A uint8 mask that is 255 inside the circle and 0 outside of it.
+    """
+    mask = np.zeros((dim[1], dim[0]), np.uint8)
+    cv2.fillPoly(mask, [np.int32(poly)], 255)
+    return mask
+
+def bounding_box(poly, dim):
+    """Finds the bounding box of the circle of interest, clipped to the frame.
+
+    Parameters
+    ----------
+    poly : array_like
+        The polygon that approximates the circle of interest.
+    dim : tuple
+        The (width, height) of the frame.
+
+    Returns
+    -------
+    tuple
+        The box as (x0, y0, x1, y1), where the end points are exclusive.
+    """
+    poly = np.int32(poly)
+    x0 = max(int(poly[:, 0].min()), 0)
+    y0 = max(int(poly[:, 1].min()), 0)
+    x1 = min(int(poly[:, 0].max()) + 1, dim[0])
+    y1 = min(int(poly[:, 1].max()) + 1, dim[1])
+    return x0, y0, x1, y1
@@ -0,0 +1,359 @@
+import argparse
+import threading
+import time
+
+import cv2
+import numpy as np
+
+import digipyro
+#------------------------------------------------------------------------------
+# *** COMMAND LINE INTERFACE SETUP ***
+# initial message for program
+msg = """ This program digitally rotates a live camera or stream as its frames
+arrive. The angle of each frame comes from the wall clock time it arrived at,
+and frames that are older than the latency budget are dropped, so the
+rotation never falls behind the source. The rotated frames are shown in a
+window and can be recorded. A movie can stand in for a camera with --loop,
+which plays it over and over at its own frame rate."""
+fmt = argparse.ArgumentDefaultsHelpFormatter
+parser = argparse.ArgumentParser(description=msg,
+                                 formatter_class=fmt)
+
+# collecting arguments for the user to change
+parser.add_argument('source', type=str,
+                    help=('The index of a camera, such as 0, or the URL of a '
+                          'stream, or with --loop the path of a movie.'))
+
+parser.add_argument('--rpm', type=float, default=10,
+                    help='The digital rotation given to the frames.')
+
+parser.add_argument('--latency', type=float, default=100,
+                    help=('The latency budget in milliseconds. Frames that '
+                          'are older than it when their turn comes, or once '
+                          'they are rotated, are dropped.'))
+
+parser.add_argument('--record', type=str, default=None,
+                    help='Record the rotated frames to this movie.')
+
+parser.add_argument('--no-show', action='store_true',
+                    help='Do not show the rotated frames in a window.')
+
+parser.add_argument('--duration', type=float, default=None,
+                    help=('Stop after this many seconds. By default, it runs '
+                          'until q or ESC is pressed or the source ends.'))
+
+parser.add_argument('--loop', action='store_true',
+                    help=('Play the source, a movie, over and over at its '
+                          'frame rate, as a stand-in for a camera.'))
+
+parser.add_argument('--crop', action='store_true',
+                    help=('Crop each frame to the square around the area of '
+                          'interest before rotating it.'))
+
+parser.add_argument('--center', type=digipyro.point, default=None,
+                    help='The axis of rotation as X,Y in pixels.')
+
+parser.add_argument('--radius', type=float, default=None,
+                    help='The radius of the area of interest in pixels.')
+
+parser.add_argument('--roi', type=str, default=None,
+                    help='A JSON file with the area of interest.')
+
+parser.add_argument('--auto', action='store_true',
+                    help='Detect the rim of the tank in the first frames.')
+#------------------------------------------------------------------------------
+
+class LoopedMovie:
+    """Plays a movie over and over at its frame rate, so it can stand in for
+    a camera. A frame is only returned once it is due, like a camera that
+    delivers frames at a fixed rate whether or not they are read.
+
+    Parameters
+    ----------
+    path : str
+        The path of the movie.
+    """
+
+    def __init__(self, path):
+        self.video = cv2.VideoCapture(path)
+        self.fps = self.video.get(cv2.CAP_PROP_FPS) or 30
+        self.start = None
+        self.count = 0
+
+    def isOpened(self):
+        return self.video.isOpened()
+
+    def get(self, prop):
+        return self.video.get(prop)
+
+    def set(self, prop, value):
+        return self.video.set(prop, value)
+
+    def read(self):
+        """Waits for the next frame to be due and reads it, going back to
+        the start of the movie at its end."""
+        now = time.monotonic()
+        if self.start is None:
+            self.start = now
+        due = self.start + self.count / self.fps
+        if due > now:
+            time.sleep(due - now)
+        else:
+            # frames that are already late are skipped, as a camera would
+            # have moved on to a newer one
+            for _ in range(int((now - due) * self.fps)):
+                self.advance(grab=True)
+        return self.advance()
+
+    def advance(self, grab=False):
+        """Reads or only grabs the next frame of the movie."""
+        self.count += 1
+        read = self.video.grab if grab else self.video.read
+        result = read()
+        if not (result if grab else result[0]):
+            self.video.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            result = read()
+        return result
+
+    def restart(self):
+        """Starts the clock again from the current frame, so the time spent
+        before the frames are read, such as in the selection window, is not
+        caught up on."""
+        self.start = None
+        self.count = 0
+
+    def release(self):
+        self.video.release()
+
+class Grabber:
+    """Reads frames from a source in a thread and keeps only the newest one,
+    with the time it arrived. Frames that are replaced before they are taken
+    are lost, which keeps the rotation from falling behind a source that is
+    faster than it.
+
+    Parameters
+    ----------
+    source : Object
+        The opened source, with a read method.
+    """
+
+    def __init__(self, source):
+        self.source = source
+        self.condition = threading.Condition()
+        self.frame = None
+        self.stamp = None
+        self.count = 0
+        self.running = True
+        self.thread = threading.Thread(target=self.grab, daemon=True)
+        self.thread.start()
+
+    def grab(self):
+        while self.running:
+            ret, frame = self.source.read()
+            stamp = time.monotonic()
+            with self.condition:
+                if not ret:
+                    self.running = False
+                else:
+                    self.frame, self.stamp = frame, stamp
+                    self.count += 1
+                self.condition.notify()
+
+    def take(self, timeout=1.0):
+        """Waits for a frame newer than the last one taken.
+
+        Parameters
+        ----------
+        timeout : float
+            The longest time to wait [s].
+
+        Returns
+        -------
+        number : int
+            The number of frames read from the source so far, or 0 if no
+            new frame came in time.
+        stamp : float
+            The time the frame arrived, from time.monotonic [s].
+        frame : array_like
+            The frame.
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.frame is not None or not self.running, timeout)
+            frame, self.frame = self.frame, None
+            if frame is None:
+                return 0, None, None
+            return self.count, self.stamp, frame
+
+    def stop(self, timeout=1.0):
+        """Stops reading frames.
+
+        Parameters
+        ----------
+        timeout : float
+            The longest time to wait for the read in progress [s].
+
+        Returns
+        -------
+        bool
+            True if the thread stopped. A stalled stream or an unplugged
+            camera can keep it in a read, and then the source must not be
+            released under it.
+        """
+        self.running = False
+        self.thread.join(timeout)
+        return not self.thread.is_alive()
+
+def open_source(source, loop=False):
+    """Opens a camera, a stream or a looped movie.
+
+    Parameters
+    ----------
+    source : str
+        The index of a camera, the URL of a stream, or the path of a movie.
+    loop : bool
+        If True, the source is a movie played over and over at its frame
+        rate.
+
+    Returns
+    -------
+    Object
+        The opened source, with the methods of cv2.VideoCapture.
+    """
+    if loop:
+        capture = LoopedMovie(source)
+    elif source.isdigit():
+        capture = cv2.VideoCapture(int(source))
+    else:
+        capture = cv2.VideoCapture(source)
+    if not capture.isOpened():
+        raise IOError('could not open {}'.format(source))
+    return capture
+
+def live_rotate(source, rpm, latency=0.1, record=None, show=True,
+                duration=None, loop=False, crop=False, center=None,
+                radius=None, roi=None, auto=False):
+    """Rotates the frames of a live source as they arrive.
+
+    Parameters
+    ----------
+    source : str
+        The index of a camera, the URL of a stream, or with loop the path of
+        a movie.
+    rpm : float
+        The digital rotation [rotations per min].
+    latency : float
+        The latency budget [s]. A frame that is older than it when it is
+        taken, or once it is rotated, is dropped.
+    record : str
+        If given, the rotated frames are recorded to this movie. Dropped
+        frames are left out, so the movie is only as smooth as the rotation
+        kept up.
+    show : bool
+        If True, the rotated frames are shown in a window.
+    duration : float
+        If given, the rotation stops after this time [s].
+    loop : bool
+        If True, the source is a movie played over and over.
+    crop, center, radius, roi, auto
+        See digipyro.digi_rotate.
+
+    Returns
+    -------
+    dict
+        The frames read from the source, rotated, lost before they could be
+        taken and dropped as stale, and the mean and largest latency of the
+        rotated frames [s].
+    """
+    vid = open_source(source, loop)
+    dim = (int(vid.get(cv2.CAP_PROP_FRAME_WIDTH)),
+           int(vid.get(cv2.CAP_PROP_FRAME_HEIGHT)))
+    fps = vid.get(cv2.CAP_PROP_FPS) or 30
+
+    poly1, poly2, center, radius = digipyro.select_roi(vid, dim, 0, center,
+                                                       radius, roi, auto=auto)
+    center = (int(center[0]), int(center[1]))
+    mask, box = digipyro.prepare_mask(poly2, dim, crop)
+
+    writer = None
+    if record is not None:
+        writer = digipyro.open_writer(record, fps, dim)
+
+    # the frames only start to be read once the area of interest is known,
+    # and a looped movie starts playing then
+    if loop:
+        vid.restart()
+    grabber = Grabber(vid)
+    start = None
+    last = 0
+    lost = stale = 0
+    latencies = []
+    try:
+        while True:
+            number, stamp, frame = grabber.take()
+            if frame is None:
+                # a stalled source still stops at the end of the duration
+                if not grabber.running or (
+                        start is not None and duration is not None
+                        and time.monotonic() - start > duration):
+                    break
+                continue
+
+            # the first frame is not rotated, as with a movie
+            if start is None:
+                start = stamp
+            lost += number - last - 1
+            last = number
+
+            # a frame is dropped if it is too old to be rotated, or if it is
+            # over the budget once it is
+            age = time.monotonic() - stamp
+            if age <= latency:
+                # the negative is for the right hand rule
+                angle = -1 * 6 * rpm * (stamp - start)
+                frame = digipyro.transform_frame(frame, angle, center, dim,
+                                                 mask, box)
+                age = time.monotonic() - stamp
+
+            if age > latency:
+                stale += 1
+            else:
+                latencies.append(age)
+                if writer is not None:
+                    writer.write(frame)
+                if show:
+                    cv2.imshow('DigiPyRo live', frame)
+                    if cv2.waitKey(1) & 0xFF in (ord('q'), 27):
+                        break
+
+            if duration is not None and time.monotonic() - start > duration:
+                break
+    finally:
+        # a thread still reading is left to end with the program, as
+        # releasing the source under it can crash
+        if grabber.stop():
+            vid.release()
+        if writer is not None:
+            writer.release()
+        if show:
+            cv2.destroyAllWindows()
+
+    return {'read': grabber.count, 'rotated': len(latencies), 'lost': lost,
+            'stale': stale,
+            'latency': float(np.mean(latencies)) if latencies else None,
+            'max_latency': max(latencies, default=None)}
+
+# module runs on CLI if run on its own
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    stats = live_rotate(args.source, args.rpm, args.latency / 1000,
+                        args.record, not args.no_show, args.duration,
+                        args.loop, args.crop, args.center, args.radius,
+                        args.roi, args.auto)
+
+    print('{} frames read, {} rotated, {} lost and {} stale.'.format(
+        stats['read'], stats['rotated'], stats['lost'], stats['stale']))
+    if stats['latency'] is not None:
+        print('Latency {:.1f} ms on average, {:.1f} ms at most.'.format(
+            1000 * stats['latency'], 1000 * stats['max_latency']))
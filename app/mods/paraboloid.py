@@ -9,26 +9,29 @@ def position(t, omega, u0, v0, x0):
 
     Parameters
     ----------
-    t : float
+    t : float or array_like
         time of given moment [s]
-    omega : float
+    omega : float or array_like
         effective rotation [1/s]
-    u0 : float
+    u0 : float or array_like
         initial x-component of the velocity [cm/s]
-    v0 : float
+    v0 : float or array_like
         initial y-component of the velocity [cm/s]
-    x0 : float
+    x0 : float or array_like
         initial x-component of the position [cm]
 
     Returns
     -------
-    x, y, z : floats
-        X, y, and z componets of the position [cm].
+    x, y, z : floats or array_like
+        X, y, and z componets of the position [cm]. Arrays given are
+        broadcast against each other.
     """
     ot = omega * t
+    # sin(ot) / omega, written with sinc so omega may be zero
+    st = t * np.sinc(ot / np.pi)
 
-    x = x0 * np.cos(ot) + u0 * np.sin(ot) / omega
-    y = v0 * np.sin(ot) / omega
+    x = x0 * np.cos(ot) + u0 * st
+    y = v0 * st
     z = omega**2 / (2*g) * (x**2 + y**2)
 
     return x, y, z
@@ -81,17 +84,40 @@ def check_edge(x, y, r):
 
     Parameters
     ----------
-    x, y :  floats
+    x, y :  floats or array_like
         x and y positions of the puck [cm]
-    r : float
+    r : float or array_like
         radius of the circle
 
     Returns
     -------
-    bool
-        True if puck crossed the radius of the paraboloid
+    bool or array_like
+        True while the puck is within the radius of the paraboloid
     """
 
-    if(r > np.sqrt(x**2 + y**2)):
-        return True
-    return False
+    return r > np.sqrt(x**2 + y**2)
+
+def edge_exit(x, y, r):
+    """Finds the frame where the puck leaves the paraboloid.
+
+    Parameters
+    ----------
+    x, y : array_like
+        x and y positions of the puck [cm], with the frames along the last
+        axis. Several trajectories can be given as (trajectories, frames).
+    r : float or array_like
+        radius of the circle, with shape (trajectories, 1) for several
+
+    Returns
+    -------
+    exit_frame : int or array_like
+        The first frame off the paraboloid, or the number of frames if the
+        puck never leaves.
+    valid : array_like
+        True for each frame before the puck leaves, same shape as x.
+    """
+    inside = check_edge(x, y, r)
+    # once the puck has left, every following frame is invalid
+    valid = np.logical_and.accumulate(inside, axis=-1)
+    exit_frame = valid.sum(axis=-1)
+    return exit_frame, valid
@@ -0,0 +1,70 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def imap(frames, transform, workers, depth=None):
+    """Transforms frames on several threads and yields them in order.
+
+    A decoder thread pulls frames from the iterable and hands them to a pool
+    of transform workers. The results are yielded in their original order as
+    they are asked for. OpenCV releases the GIL during its heavy calls, so
+    the decoding, the transforms and the caller overlap with each other.
+
+    Parameters
+    ----------
+    frames : iterable
+        The frames to be transformed, in order.
+    transform : function
+        Called as transform(i, frame) and returns the new frame.
+    workers : int
+        The number of transform threads.
+    depth : int
+        The number of frames that can be in flight between the decoder and
+        the caller. This caps the memory used. Defaults to 2 * workers.
+
+    Yields
+    ------
+    array_like
+        Each transformed frame, in order.
+    """
+    depth = depth or 2 * workers
+    pending = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+    errors = []
+    done = object()
+
+    def put(item):
+        # blocks while the queue is full, unless the caller has stopped
+        while not stop.is_set():
+            try:
+                pending.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def decode(pool):
+        try:
+            for i, frame in enumerate(frames):
+                if not put(pool.submit(transform, i, frame)):
+                    return
+        except Exception as err:
+            errors.append(err)
+        put(done)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        decoder = threading.Thread(target=decode, args=(pool,), daemon=True)
+        decoder.start()
+        try:
+            while True:
+                future = pending.get()
+                if future is done:
+                    break
+                yield future.result()
+        finally:
+            stop.set()
+            decoder.join()
+
+    if errors:
+        raise errors[0]
@@ -0,0 +1,158 @@
+import cv2
+import numpy as np
+
+
+class PolarGrid:
+    """Rotates frames in polar coordinates. About a fixed center a rotation
+    is only a shift along the angle, so each frame is unwrapped once with
+    remap tables computed up front, shifted, and, for movies, wrapped back.
+    The unwrapped frames are a compact (angle, radius) image that tracking
+    and radial profiles can use directly.
+
+    Parameters
+    ----------
+    center : tuple
+        The axis of rotation in the frame [px].
+    radius : float
+        The radius of the area of interest [px]. Nothing outside of it is
+        unwrapped.
+    dim : tuple
+        The (width, height) of the frames, and of the frames wrapped back.
+    bins : int
+        The number of angles. Defaults to one pixel along the rim.
+    radii : int
+        The number of radii. Defaults to one per pixel.
+    """
+
+    def __init__(self, center, radius, dim, bins=None, radii=None):
+        self.center = center
+        self.radius = radius
+        self.dim = dim
+        self.bins = bins or int(round(2 * np.pi * radius))
+        self.radii = radii or int(round(radius))
+
+        # the point of the frame at each (angle, radius) of the grid
+        theta = 2 * np.pi * np.arange(self.bins) / self.bins
+        r = radius * np.arange(self.radii) / self.radii
+        self.map_x = (center[0] + np.outer(np.cos(theta), r)).astype(
+            np.float32)
+        self.map_y = (center[1] + np.outer(np.sin(theta), r)).astype(
+            np.float32)
+
+        # the point of the grid at each pixel of a frame centered on the
+        # middle, which is where interaction.rotation_matrix puts the center
+        x = np.arange(dim[0]) - dim[0] / 2
+        y = np.arange(dim[1]) - dim[1] / 2
+        x, y = np.meshgrid(x, y)
+        rho = np.hypot(x, y)
+        phi = np.arctan2(y, x) % (2 * np.pi)
+        self.inv_x = (rho * self.radii / radius).astype(np.float32)
+        self.inv_y = (phi * self.bins / (2 * np.pi)).astype(np.float32)
+        # pixels outside the radius fall off the grid and stay black
+        self.inv_x[rho >= radius] = -1
+
+    @property
+    def shape(self):
+        """The (width, height) of the unwrapped frames."""
+        return (self.radii, self.bins)
+
+    def unwrap(self, frame, interpolation=cv2.INTER_LINEAR):
+        """Unwraps the area of interest of a frame.
+
+        Parameters
+        ----------
+        frame : array_like
+            The frame read from the film.
+        interpolation : int
+            The interpolation used to sample the frame.
+
+        Returns
+        -------
+        array_like
+            The unwrapped frame. Each row is an angle, each column a radius.
+        """
+        return cv2.remap(frame, self.map_x, self.map_y, interpolation)
+
+    def rotate(self, polar, angle):
+        """Rotates an unwrapped frame by a shift along the angle, which wraps
+        around. The shift can be a fraction of a row.
+
+        Parameters
+        ----------
+        polar : array_like
+            The unwrapped frame.
+        angle : float
+            The rotation angle, in the sense of interaction.rotation_matrix
+            [deg].
+
+        Returns
+        -------
+        array_like
+            The rotated, unwrapped frame.
+        """
+        shift = angle * self.bins / 360
+        whole = int(np.floor(shift))
+        part = shift - whole
+        whole %= self.bins
+
+        # with the angles repeated, any whole shift is a view, and the part
+        # of a row left over is a blend of the two nearest views
+        repeated = np.concatenate([polar, polar])
+        return cv2.addWeighted(repeated[whole:whole + self.bins], 1 - part,
+                               repeated[whole + 1:whole + 1 + self.bins], part,
+                               0)
+
+    def wrap(self, polar, interpolation=cv2.INTER_LINEAR):
+        """Maps an unwrapped frame back to a frame centered on the middle.
+
+        Parameters
+        ----------
+        polar : array_like
+            The unwrapped frame.
+        interpolation : int
+            The interpolation used to sample the unwrapped frame.
+
+        Returns
+        -------
+        array_like
+            The frame, black outside of the radius.
+        """
+        # the first angle is repeated after the last, so there is no seam
+        polar = cv2.copyMakeBorder(polar, 0, 1, 0, 0, cv2.BORDER_WRAP)
+        return cv2.remap(polar, self.inv_x, self.inv_y, interpolation)
+
+    def to_frame(self, positions):
+        """Finds the positions in the wrapped frame of positions in the
+        unwrapped frame.
+
+        Parameters
+        ----------
+        positions : array_like
+            The (radius, angle) positions in the unwrapped frame [px],
+            shape (n, 2).
+
+        Returns
+        -------
+        array_like
+            The (x, y) positions in the frame wrapped back [px].
+        """
+        rho = positions[:, 0] * self.radius / self.radii
+        phi = positions[:, 1] * 2 * np.pi / self.bins
+        x = self.dim[0] / 2 + rho * np.cos(phi)
+        y = self.dim[1] / 2 + rho * np.sin(phi)
+        return np.stack([x, y], axis=1)
+
+def radial_profile(polar):
+    """Averages an unwrapped frame over the angle.
+
+    Parameters
+    ----------
+    polar : array_like
+        The unwrapped frame made by PolarGrid.
+
+    Returns
+    -------
+    array_like
+        The mean of each radius, for each channel.
+    """
+    return polar.mean(axis=0)
@@ -0,0 +1,203 @@
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+import paraboloid as pbd
+import synth
+#------------------------------------------------------------------------------
+# *** COMMAND LINE INTERFACE SETUP ***
+# initial message for program
+msg = """ This program creates a synthetic movie for every combination of the
+parameters given. All trajectories are computed at once, combinations where
+the puck goes off the edge of the paraboloid are skipped, and the rest are
+rendered in parallel. A manifest maps each combination to its movie."""
+fmt = argparse.ArgumentDefaultsHelpFormatter
+parser = argparse.ArgumentParser(description = msg,
+                                 formatter_class=fmt)
+
+# collecting arguments for the user to change
+parser.add_argument('-t', '--time', type=float, default=6,
+                    help='The length of the movies in seconds.')
+
+parser.add_argument('-r', '--rpm_topo', type=float, nargs='+', default=[10],
+                    help='The rotation rates of the paraboloid surface.')
+
+parser.add_argument('-u', '--u0', type=float, nargs='+', default=[0],
+                    help='The initial x-velocities in cm/s of the puck.')
+
+parser.add_argument('-v', '--v0', type=float, nargs='+', default=[0],
+                    help='The initial y-velocities in cm/s of the puck.')
+
+parser.add_argument('-x', '--x0', type=float, nargs='+', default=[1],
+                    help='The initial x-positions in cm of the puck.')
+
+parser.add_argument('-R', '--radius', type=float, nargs='+', default=[2],
+                    help='The radii of the paraboloid in cm.')
+
+parser.add_argument('-f', '--fps', type=float, default=30,
+                    help='The frame rate of the movies.')
+
+parser.add_argument('-d', '--dim', type=str, default='720,720',
+                    help='The width and height in pixels of the movies, W,H.')
+
+parser.add_argument('-o', '--out', type=str, default='sweep',
+                    help='The directory the movies and manifest are saved in.')
+
+parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(),
+                    help='The number of movies rendered at the same time.')
+#------------------------------------------------------------------------------
+
+# the order of the parameters in the grid
+names = ('rpm_topo', 'u0', 'v0', 'x0', 'radius')
+
+def make_grid(rpm_topo, u0, v0, x0, radius):
+    """Creates every combination of the parameters.
+
+    Parameters
+    ----------
+    rpm_topo, u0, v0, x0, radius : list
+        The values of each parameter.
+
+    Returns
+    -------
+    array_like
+        The combinations, shape (params, 5), in the order of names.
+    """
+    return np.array(list(itertools.product(rpm_topo, u0, v0, x0, radius)),
+                    dtype=float).reshape(-1, len(names))
+
+def trajectories(grid, time, fps):
+    """Computes the trajectories of every combination at once.
+
+    Parameters
+    ----------
+    grid : array_like
+        The combinations made by make_grid.
+    time : float
+        The length of the movies [s].
+    fps : float
+        The frame rate of the movies.
+
+    Returns
+    -------
+    x, y, z : array_like
+        The positions of the puck, shape (params, frames) [cm].
+    """
+    # same times as synth.render_paraboloid
+    t = np.arange(int(time*fps)) / fps
+    omega = 2*np.pi*grid[:, 0:1]/60
+    u0, v0, x0 = grid[:, 1:2], grid[:, 2:3], grid[:, 3:4]
+    return pbd.position(t[np.newaxis, :], omega, u0, v0, x0)
+
+def exit_frames(grid, x, y):
+    """Finds the frame where the puck leaves the paraboloid in every
+    combination at once.
+
+    Parameters
+    ----------
+    grid : array_like
+        The combinations made by make_grid.
+    x, y : array_like
+        The positions of the puck, shape (params, frames) [cm].
+
+    Returns
+    -------
+    array_like
+        The first frame off the surface for each combination, or the number
+        of frames if the puck stays on it.
+    """
+    exit_frame, _ = pbd.edge_exit(x, y, grid[:, 4:5])
+    return exit_frame
+
+def render_movie(params, name, time, fps, dim):
+    """Renders and saves the movie of one combination. This is run in a worker
+    process.
+
+    Parameters
+    ----------
+    params : array_like
+        One row of the grid.
+    name : str
+        The file name of the movie.
+    time, fps, dim
+        See synth.render_paraboloid.
+
+    Returns
+    -------
+    str
+        The file name of the movie.
+    """
+    rpm_topo, u0, v0, x0, radius = params
+    omega = 2*np.pi*rpm_topo/60
+    frames = synth.render_paraboloid(time, omega, u0, v0, x0, radius, fps,
+                                     dim)
+    synth.save_frames(frames, name, fps, dim)
+    return name
+
+def run_sweep(grid, time, out, fps=30, dim=(720, 720), jobs=1):
+    """Renders the movies of every combination that stays on the surface and
+    writes a manifest of the sweep.
+
+    Parameters
+    ----------
+    grid : array_like
+        The combinations made by make_grid.
+    time : float
+        The length of the movies [s].
+    out : str
+        The directory the movies and the manifest are saved in.
+    fps : float
+        The frame rate of the movies.
+    dim : tuple
+        The (width, height) of the movies.
+    jobs : int
+        The number of movies rendered at the same time.
+
+    Returns
+    -------
+    list
+        The entries of the manifest, one per combination.
+    """
+    os.makedirs(out, exist_ok=True)
+
+    x, y, z = trajectories(grid, time, fps)
+    exits = exit_frames(grid, x, y)
+
+    entries = []
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = []
+        for n, params in enumerate(grid):
+            entry = dict(zip(names, params.tolist()))
+            if exits[n] == x.shape[1]:
+                name = os.path.join(out, 'sweep-{:04d}.mp4'.format(n))
+                futures.append(pool.submit(render_movie, params, name, time,
+                                           fps, dim))
+                entry.update(status='rendered', file=name)
+            else:
+                entry.update(status='off-edge', file=None,
+                             exit_frame=int(exits[n]))
+            entries.append(entry)
+
+        # raise any error from the workers
+        for future in futures:
+            future.result()
+
+    with open(os.path.join(out, 'manifest.json'), 'w') as f:
+        json.dump(entries, f, indent=2)
+    return entries
+
+# module runs on CLI if run on its own
+if __name__ == "__main__":
+    args = parser.parse_args()
+
+    grid = make_grid(args.rpm_topo, args.u0, args.v0, args.x0, args.radius)
+    dim = tuple(int(n) for n in args.dim.split(','))
+    entries = run_sweep(grid, args.time, args.out, args.fps, dim, args.jobs)
+
+    rendered = sum(entry['status'] == 'rendered' for entry in entries)
+    print('{} of {} movies rendered, {} went off the edge.'.format(
+        rendered, len(entries), len(entries) - rendered))
@@ -1,5 +1,6 @@
 import argparse
 
+import cv2
 import numpy as np
 import matplotlib.pyplot as plt
 import matplotlib.animation as animate
@@ -56,19 +57,44 @@ parser.add_argument('-s', '--switch', type=int, default=0,
                     help=('Choice to either show the animation or save it. '
                           'Default displays the animation. Option [1] will '
                           'save the animation as an mp4.'))
+
+parser.add_argument('--fast', action='store_true',
+                    help=('Draw the top view straight into the video frames '
+                          'with OpenCV instead of matplotlib. This is much '
+                          'faster and always saves the movie.'))
+
+parser.add_argument('-f', '--fps', type=float, default=30,
+                    help='The frame rate of the movie made with --fast.')
+
+parser.add_argument('-d', '--dim', type=str, default='720,720',
+                    help=('The width and height in pixels of the movie made '
+                          'with --fast, given as W,H.'))
 #------------------------------------------------------------------------------
 
-# collecting user input into list
-args = parser.parse_args()
+def on_surface(x, y, z, t, radius):
+    """Cuts the trajectory at the frame where the puck leaves the paraboloid,
+    with a warning, so no frames are made of a puck off the surface.
 
-time = args.time
-omega = 2*np.pi*args.rpm_topo/60
-u0 = args.u0
-v0 = args.v0
-x0 = args.x0
-radius = args.radius
-name = args.name + ".mp4"
-switch = args.switch
+    Parameters
+    ----------
+    x, y, z : array_like
+        position of the puck in each frame [cm]
+    t : array_like
+        time of each frame [s]
+    radius : float
+        radius of the paraboloid [cm]
+
+    Returns
+    -------
+    x, y, z, t : array_like
+        The frames of the trajectory before the puck leaves.
+    """
+    exit_frame, _ = pbd.edge_exit(x, y, radius)
+    if exit_frame < len(t):
+        print('The puck goes off the edge at {:.2f} s, the movie is cut '
+              'there.'.format(t[exit_frame]))
+    return (x[:exit_frame], y[:exit_frame], z[:exit_frame],
+            t[:exit_frame])
 
 def animate_paraboloid(time, omega, u0, v0, x0, radius):
     """Animates the paraboloid.
@@ -100,8 +126,6 @@ def animate_paraboloid(time, omega, u0, v0, x0, radius):
     rmax = radius*1.5
     size = (-1*(rmax), rmax)
 
-    xt, yt = [], []
-
     resize = (150,75)
     spinlab = Image.open('../static/SpinLabUCLA_BW_strokes.png')
     spinlab = spinlab.resize(resize)
@@ -148,9 +172,15 @@ def animate_paraboloid(time, omega, u0, v0, x0, radius):
     # calculating out the values for each from
     fps = 30
     t = np.linspace(start=0, stop=time, num=int(time*fps))
-    frames = len(t)
     x, y, z = pbd.position(t, omega, u0, v0, x0)
-    dot = omega * t[1]
+    x, y, z, t = on_surface(x, y, z, t, radius)
+    frames = len(t)
+
+    # the trajectory inprint on the rotating axis at frame i is each earlier
+    # point rotated by omega * (t[i] - t[j]); undoing the rotation of each
+    # point once up front leaves a single rotation by omega * t[i] per frame
+    xt = x * np.cos(omega * t) + y * np.sin(omega * t)
+    yt = -x * np.sin(omega * t) + y * np.cos(omega * t)
 
     def init():
         """Initialization function for the animation.
@@ -167,20 +197,14 @@ def animate_paraboloid(time, omega, u0, v0, x0, radius):
         zpos = z[i]
 
         # rotation of trajectory inprint on rotating axis
-        for j in range(i):
-            xn = xt[j] * np.cos(dot) - yt[j] * np.sin(dot)
-            yn = xt[j] * np.sin(dot) + yt[j] * np.cos(dot)
-            xt[j] = xn
-            yt[j] = yn
-
-        # adding points to the rotating axis
-        xt.append(xpos)
-        yt.append(ypos)
+        dot = omega * t[i]
+        xn = xt[:i+1] * np.cos(dot) - yt[:i+1] * np.sin(dot)
+        yn = xt[:i+1] * np.sin(dot) + yt[:i+1] * np.cos(dot)
 
         # setting points for animation
-        puckTop.set_data(xpos, ypos)
-        puckInt.set_data(xt, yt)
-        puckSide.set_data(xpos, zpos)
+        puckTop.set_data([xpos], [ypos])
+        puckInt.set_data(xn, yn)
+        puckSide.set_data([xpos], [zpos])
 
         return puckTop, puckInt, puckSide
 
@@ -191,6 +215,97 @@ def animate_paraboloid(time, omega, u0, v0, x0, radius):
                                       blit=True)
     return animation
 
+def render_paraboloid(time, omega, u0, v0, x0, radius, fps=30, dim=(720, 720),
+                      trail=True):
+    """Draws the top view of the paraboloid straight into video frames. This is
+    a fast alternative to animate_paraboloid for making test movies.
+
+    Parameters
+    ----------
+    time : float
+        length of animation in seconds
+    omega : float
+        effective rotation [1/s]
+    u0 : float
+        initial x-component of the velocity [cm/s]
+    v0 : float
+        initial y-component of the velocity [cm/s]
+    x0 : float
+        initial x-component of the position [cm]
+    radius : float
+        radius of the paraboloid [cm]
+    fps : float
+        frame rate of the movie
+    dim : tuple
+        (width, height) of the frames in pixels
+    trail : bool
+        If True, the path in the rotating axis is drawn behind the puck.
+
+    Yields
+    ------
+    array_like
+        Each BGR frame of the movie.
+    """
+    width, height = dim
+    t = np.arange(int(time*fps)) / fps
+    x, y, z = pbd.position(t, omega, u0, v0, x0)
+    x, y, z, t = on_surface(x, y, z, t, radius)
+
+    # the view spans the same area as the matplotlib plots, with y up
+    scale = min(width, height) / (2 * radius * 1.5)
+    px = np.round(width / 2 + x * scale).astype(int)
+    py = np.round(height / 2 - y * scale).astype(int)
+
+    # points un-rotated once, see animate_paraboloid
+    xt = x * np.cos(omega * t) + y * np.sin(omega * t)
+    yt = -x * np.sin(omega * t) + y * np.cos(omega * t)
+
+    # the rim does not move, so it is only drawn once
+    background = np.zeros((height, width, 3), np.uint8)
+    cv2.circle(background, (width // 2, height // 2), int(radius * scale),
+               (255, 255, 255), 2, cv2.LINE_AA)
+    dot = max(int(0.08 * radius * scale), 2)
+
+    for i in range(len(t)):
+        frame = background.copy()
+
+        if trail:
+            # rotation of trajectory inprint on rotating axis
+            c, s = np.cos(omega * t[i]), np.sin(omega * t[i])
+            tx = np.round(width / 2 + (xt[:i+1]*c - yt[:i+1]*s) * scale)
+            ty = np.round(height / 2 - (xt[:i+1]*s + yt[:i+1]*c) * scale)
+            keep = (tx >= 0) & (tx < width-1) & (ty >= 0) & (ty < height-1)
+            tx = tx[keep].astype(int)
+            ty = ty[keep].astype(int)
+            # 2x2 points survive the chroma subsampling of the codec
+            for dx, dy in ((0, 0), (1, 0), (0, 1), (1, 1)):
+                frame[ty + dy, tx + dx] = (0, 255, 0)
+
+        cv2.circle(frame, (px[i], py[i]), dot, (255, 255, 255), -1,
+                   cv2.LINE_AA)
+        cv2.circle(frame, (px[i], py[i]), dot, (0, 0, 255), 1, cv2.LINE_AA)
+        yield frame
+
+def save_frames(frames, name, fps=30, dim=(720, 720)):
+    """Saves frames made by render_paraboloid as an mp4.
+
+    Parameters
+    ----------
+    frames : iterable
+        The BGR frames of the movie.
+    name : str
+        The file name of the movie.
+    fps : float
+        The frame rate of the movie.
+    dim : tuple
+        The (width, height) of the frames.
+    """
+    fourcc = cv2.VideoWriter_fourcc('m', 'p', '4', 'v')
+    video_writer = cv2.VideoWriter(name, fourcc, fps, dim)
+    for frame in frames:
+        video_writer.write(frame)
+    video_writer.release()
+
 def save_animation(animation, name):
     """Saves animation when called.
 
@@ -199,9 +314,22 @@ def save_animation(animation, name):
 
 # module runs on CLI if run on its own
 if __name__ == "__main__":
-    animation = animate_paraboloid(time, omega, u0, v0, x0, radius)
-
-    if switch == 0:
-        plt.show()
-    elif switch == 1:
-        save_animation(animation, '../../../' + name)
\ No newline at end of file
+    # collecting user input
+    args = parser.parse_args()
+
+    omega = 2*np.pi*args.rpm_topo/60
+    name = '../../../' + args.name + ".mp4"
+
+    if args.fast:
+        dim = tuple(int(n) for n in args.dim.split(','))
+        frames = render_paraboloid(args.time, omega, args.u0, args.v0,
+                                   args.x0, args.radius, args.fps, dim)
+        save_frames(frames, name, args.fps, dim)
+    else:
+        animation = animate_paraboloid(args.time, omega, args.u0, args.v0,
+                                       args.x0, args.radius)
+
+        if args.switch == 0:
+            plt.show()
+        elif args.switch == 1:
+            save_animation(animation, name)
@@ -0,0 +1,171 @@
+import contextlib
+import sys
+import threading
+import time
+from collections import deque
+
+
+class Telemetry:
+    """Measures where the time of a rotation goes and how fast frames are
+    written. The time of each stage (read, resize, mask, warp, write, ...)
+    adds up across threads, so with several workers the stages can add up to
+    more than the wall time. The rotation and the recentering are done by
+    the same warp, so both are counted as warp.
+
+    Parameters
+    ----------
+    frames : int
+        The number of frames expected, used for the ETA.
+    callback : function
+        If given, called with the metrics every interval seconds and once
+        more when the rotation finishes.
+    interval : float
+        The time between calls of the callback [s].
+    window : float
+        The time the rolling frame rate is averaged over [s].
+    """
+
+    def __init__(self, frames, callback=None, interval=1.0, window=5.0):
+        self.frames = frames
+        self.callback = callback
+        self.interval = interval
+        self.window = window
+        self.stages = {}
+        self.done = 0
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.reported = self.start
+        self.recent = deque([(self.start, 0)])
+
+    def add(self, stage, seconds):
+        """Adds time to a stage. It is safe to call from several threads."""
+        with self.lock:
+            self.stages[stage] = self.stages.get(stage, 0) + seconds
+
+    def merge(self, stages):
+        """Adds the stage times measured elsewhere, such as in another
+        process."""
+        for stage, seconds in stages.items():
+            self.add(stage, seconds)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Times the code run within it as a stage."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+
+    def iterate(self, name, iterable):
+        """Times how long each item of an iterable takes to produce.
+
+        Yields
+        ------
+        object
+            Each item of the iterable.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                item = next(iterator, self)
+            if item is self:
+                return
+            yield item
+
+    def tick(self, count=1):
+        """Records frames that were written, calling the callback when it is
+        due."""
+        now = time.perf_counter()
+        self.done += count
+        self.recent.append((now, self.done))
+        # keep at least two points so there is always a rate
+        while len(self.recent) > 2 and now - self.recent[0][0] > self.window:
+            self.recent.popleft()
+
+        if self.callback is not None and now - self.reported >= self.interval:
+            self.reported = now
+            self.callback(self.metrics())
+
+    def metrics(self, finished=False):
+        """Collects the metrics so far.
+
+        Parameters
+        ----------
+        finished : bool
+            If True, the frame rate is the average of the whole rotation.
+
+        Returns
+        -------
+        dict
+            The frames written and expected, the elapsed time [s], the
+            rolling frame rate, the ETA [s] (None when unknown) and the
+            time of each stage [s].
+        """
+        now = time.perf_counter()
+        elapsed = now - self.start
+        if finished:
+            fps = self.done / elapsed if elapsed > 0 else 0
+        else:
+            (t0, n0), (t1, n1) = self.recent[0], self.recent[-1]
+            fps = (n1 - n0) / (t1 - t0) if t1 > t0 else 0
+
+        eta = None
+        if fps > 0:
+            eta = max(self.frames - self.done, 0) / fps
+        with self.lock:
+            stages = dict(self.stages)
+        return {'done': self.done, 'frames': self.frames,
+                'elapsed': elapsed, 'fps': fps, 'eta': eta,
+                'stages': stages, 'finished': finished}
+
+    def finish(self):
+        """Calls the callback a last time with the final metrics.
+
+        Returns
+        -------
+        dict
+            The final metrics.
+        """
+        metrics = self.metrics(finished=True)
+        if self.callback is not None:
+            self.callback(metrics)
+        return metrics
+
+def clock(seconds):
+    """Formats a time as minutes and seconds."""
+    if seconds is None:
+        return '--:--'
+    return '{:d}:{:02d}'.format(*divmod(int(seconds), 60))
+
+def show_progress(metrics, stream=sys.stderr):
+    """Shows the metrics on a single terminal line, and the time taken by
+    each stage once the rotation finishes. This is a callback for Telemetry.
+
+    Parameters
+    ----------
+    metrics : dict
+        The metrics made by Telemetry.metrics.
+    stream : file
+        The stream the progress is written to.
+    """
+    stages = metrics['stages']
+    total = sum(stages.values())
+
+    # the slowest stage hints at what the rotation is bound by
+    slowest = ''
+    if total > 0:
+        name = max(stages, key=stages.get)
+        slowest = '  {} {:.0%}'.format(name, stages[name] / total)
+
+    stream.write('\r{}/{} frames  {:.1f} fps  ETA {}  elapsed {}{}   '.format(
+        metrics['done'], metrics['frames'], metrics['fps'],
+        clock(metrics['eta']), clock(metrics['elapsed']), slowest))
+
+    if metrics['finished']:
+        stream.write('\n')
+        for name, seconds in stages.items():
+            share = seconds / total if total > 0 else 0
+            stream.write('  {:8s} {:8.2f} s  {:4.0%}\n'.format(name, seconds,
+                                                              share))
+    stream.flush()
@@ -0,0 +1,210 @@
+import cv2
+import numpy as np
+
+
+class Tracker:
+    """Follows a single particle through the frames of a film. The particle is
+    found by thresholding, or by subtracting a running background, and taking
+    the centroid of a blob: the largest one at first, then the one nearest to
+    its last position. Once found, only a window around its last position is
+    searched, which keeps tracking cheap for large frames.
+
+    Parameters
+    ----------
+    threshold : int
+        The gray level that separates the particle from the background. With
+        background subtraction this is the difference to the background.
+    window : int
+        The half-width of the search window around the last position [px].
+    background : bool
+        If True, a running background is subtracted before thresholding.
+    min_area : int
+        The smallest blob that counts as the particle [px].
+    seed : int
+        The number of frames whose median starts the background. The
+        particle is searched in them once the background is known.
+    rate : float
+        The weight of each new frame in the running background.
+    """
+
+    def __init__(self, threshold=200, window=50, background=False,
+                 min_area=3, seed=10, rate=0.05):
+        self.threshold = threshold
+        self.window = window
+        self.background = background
+        self.min_area = min_area
+        self.seed = seed
+        self.rate = rate
+        self.model = None
+        self.seeds = []
+        self.last = None
+        self.blob = None
+        self.positions = []
+
+    def search(self, gray, x0, y0):
+        """Finds the particle in part of a frame.
+
+        Parameters
+        ----------
+        gray : array_like
+            The grayscale part of the frame to search.
+        x0, y0 : int
+            The position of the part in the frame.
+
+        Returns
+        -------
+        tuple
+            The (x, y) position of the particle in the frame, or None.
+        """
+        if self.background:
+            model = self.model[y0:y0 + gray.shape[0], x0:x0 + gray.shape[1]]
+            diff = np.abs(gray - model).astype(np.uint8)
+        else:
+            diff = gray
+
+        _, binary = cv2.threshold(diff, self.threshold, 255,
+                                  cv2.THRESH_BINARY)
+        n, _, stats, centroids = cv2.connectedComponentsWithStats(binary)
+        # label 0 is the background
+        blobs = [k for k in range(1, n)
+                 if stats[k, cv2.CC_STAT_AREA] >= self.min_area]
+        if not blobs:
+            return None
+
+        if self.last is None:
+            best = max(blobs, key=lambda k: stats[k, cv2.CC_STAT_AREA])
+        else:
+            # anything else that stands out, such as a part of the
+            # background that changed, is further away
+            distance = np.hypot(centroids[blobs, 0] + x0 - self.last[0],
+                                centroids[blobs, 1] + y0 - self.last[1])
+            best = blobs[int(np.argmin(distance))]
+
+        x, y, w, h = stats[best, :4]
+        self.blob = (x + x0, y + y0, w, h)
+        x, y = centroids[best]
+        return x + x0, y + y0
+
+    def locate(self, gray):
+        """Finds the particle in a grayscale frame, records its position and
+        updates the background."""
+        found = None
+        if self.last is not None:
+            x, y = self.last
+            x0 = max(int(x) - self.window, 0)
+            y0 = max(int(y) - self.window, 0)
+            x1 = int(x) + self.window + 1
+            y1 = int(y) + self.window + 1
+            found = self.search(gray[y0:y1, x0:x1], x0, y0)
+
+        # search the whole frame if the particle was lost
+        if found is None:
+            found = self.search(gray, 0, 0)
+
+        if self.background:
+            # the whole background follows slow changes, except where the
+            # particle is, so it does not fade into it
+            keep = np.full(gray.shape, 255, np.uint8)
+            if found is not None:
+                x, y, w, h = self.blob
+                keep[max(y - 2, 0):y + h + 2, max(x - 2, 0):x + w + 2] = 0
+            cv2.accumulateWeighted(gray, self.model, self.rate, keep)
+
+        self.last = found
+        if found is None:
+            self.positions.append((np.nan, np.nan))
+        else:
+            self.positions.append(found)
+        return found
+
+    def update(self, frame):
+        """Finds the particle in the next frame and records its position.
+
+        Parameters
+        ----------
+        frame : array_like
+            The next frame of the film.
+
+        Returns
+        -------
+        tuple
+            The (x, y) position of the particle, or None if it was not found
+            or the background is not known yet.
+        """
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if not self.background or self.model is not None:
+            return self.locate(gray)
+
+        # the particle moves, so the median of the first frames is the
+        # background without it
+        self.seeds.append(gray)
+        if len(self.seeds) < self.seed:
+            return None
+        self.model = np.median(np.stack(self.seeds), axis=0).astype(
+            np.float32)
+        seeds, self.seeds = self.seeds, []
+        for gray in seeds:
+            found = self.locate(gray)
+        return found
+
+    def finish(self):
+        """Records the frames still waiting for the background, for films
+        shorter than the seed, as not found."""
+        self.positions.extend([(np.nan, np.nan)] * len(self.seeds))
+        self.seeds = []
+
+def to_lab(positions, angles, center, dim):
+    """Finds the positions in the lab frame from the positions in the rotated,
+    re-centered frames. This undoes interaction.rotation_matrix.
+
+    Parameters
+    ----------
+    positions : array_like
+        The (x, y) positions in the rotated frames, shape (frames, 2).
+    angles : array_like
+        The rotation angle of each frame [deg].
+    center : tuple
+        The axis of rotation.
+    dim : tuple
+        The (width, height) of the frames.
+
+    Returns
+    -------
+    array_like
+        The (x, y) positions in the lab frame, shape (frames, 2).
+    """
+    # the rotated frame is centered on the middle of the frame
+    dx = positions[:, 0] - dim[0] / 2
+    dy = positions[:, 1] - dim[1] / 2
+
+    # the rotation matrix is orthogonal, so the transpose inverts it
+    theta = np.deg2rad(angles)
+    c, s = np.cos(theta), np.sin(theta)
+    x = c * dx - s * dy + center[0]
+    y = s * dx + c * dy + center[1]
+    return np.stack([x, y], axis=1)
+
+def save_track(path, times, lab, rotated):
+    """Saves the trajectory of the particle. A .npy path saves a NumPy array,
+    anything else a CSV file. Both have the columns frame, time, x_lab, y_lab,
+    x_rot and y_rot, with NaN where the particle was not found.
+
+    Parameters
+    ----------
+    path : str
+        The path of the trajectory file.
+    times : array_like
+        The time of each frame [s].
+    lab : array_like
+        The (x, y) positions in the lab frame [px].
+    rotated : array_like
+        The (x, y) positions in the rotated frame [px].
+    """
+    frames = np.arange(len(times))
+    track = np.column_stack([frames, times, lab, rotated])
+
+    if path.endswith('.npy'):
+        np.save(path, track)
+    else:
+        np.savetxt(path, track, delimiter=',', fmt='%.6g',
+                   header='frame,time,x_lab,y_lab,x_rot,y_rot', comments='')